@@ -8,260 +8,456 @@ Permite visualizar e gerenciar saques, verificar lucros e outras tarefas.
 import telebot
 from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton
 import logging
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import config
 import database
 import pay
+import throttle
 
 logger = logging.getLogger(__name__)
 bot = None  # Instância global do bot, inicializada por register_admin_handlers
 
+# Máximo de saques enviados por clique em "Ver Saques Pendentes" (os demais ficam no botão "Próximos")
+PENDING_NOTIFY_LIMIT = 10
+# Pool para os payouts, que são chamadas lentas ao gateway e não devem bloquear os handlers
+_PAYOUT_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="adm-payout")
+
+# Edições pendentes das mensagens do painel, por (chat_id, message_id), para coalescer cliques em rajada
+_EDIT_DEBOUNCE_SECONDS = 0.3
+_edit_debounce = {}
+_edit_debounce_lock = threading.Lock()
+
+# Estado do fluxo /setsaldo por admin: {admin_id: {"stage": ..., "target_user_id": ...}}
+_PENDING_SETSALDO = {}
+
+# Teclado do painel: totalmente estático, montado uma única vez na importação
+_ADMIN_PANEL_MARKUP = InlineKeyboardMarkup(row_width=1).add(
+    InlineKeyboardButton("💰 Ver Saques Pendentes", callback_data="admin_view_pending"),
+    InlineKeyboardButton("📈 Ver Lucro com Taxas", callback_data="admin_view_profit"),
+    InlineKeyboardButton("👤 Administrar Saldo de Usuário", callback_data="admin_user_menu"),
+    InlineKeyboardButton("👥 Ver Saldos de Usuários", callback_data="admin_view_balances"),
+)
+# Texto da notificação de novo saque, montado uma vez por saque e enviado a todos os admins
+_NOTIFY_TEMPLATE = (
+    "⚠️ *Nova Solicitação de Saque Pendente:*\n\n"
+    "👤 *Usuário:* {name} (`{uid}`)\n"
+    "🆔 *ID da Transação:* `{tid}`\n\n"
+    "💸 *Valor a Pagar (Líquido):* `R$ {amount:.2f}`\n"
+    "🔑 *Chave PIX:* `{pix}`"
+)
+_BTN_APPROVE_TEXT = "✅ Aprovar Pagamento"
+_BTN_REJECT_TEXT = "❌ Recusar e Estornar"
+
+# Formatos aceitos de callback_data, validados antes de qualquer acesso ao banco
+_WITHDRAW_RE = re.compile(r"^admin_withdraw_(approve|reject)_(\d+)$")
+_VIEW_RE = re.compile(r"^admin_view_(pending|profit|balances)$")
+_BALANCES_PAGE_RE = re.compile(r"^admin_balances_page_(\d+)$")
+_PENDING_NEXT_RE = re.compile(r"^admin_pending_next_(\d+)$")
+
+# Quantidade de usuários exibidos por página na listagem de saldos
+BALANCES_PAGE_SIZE = 20
+
+# -------------------------------------
+# ENVIO COM LIMITE DE TAXA
+# -------------------------------------
+# Todas as chamadas de saída à API do Telegram passam pelo throttle, que aplica
+# o limite global do bot e o limite por chat, e reenvia uma vez em caso de 429.
+def _send_message(chat_id, text, **kwargs):
+    return throttle.call(bot.send_message, chat_id, text, chat_id=chat_id, **kwargs)
+
+def _reply_to(message, text, **kwargs):
+    return throttle.call(bot.reply_to, message, text, chat_id=message.chat.id, **kwargs)
+
+def _edit_message_text(text, chat_id, message_id, **kwargs):
+    return throttle.call(bot.edit_message_text, text, chat_id, message_id, chat_id=chat_id, **kwargs)
+
+def _answer_callback_query(callback_query_id, *args, **kwargs):
+    return throttle.call(bot.answer_callback_query, callback_query_id, *args, **kwargs)
+
+def _debounced_edit(text, chat_id, message_id, **kwargs):
+    """
+    Agenda a edição de uma mensagem do painel. Edições para a mesma mensagem dentro de
+    _EDIT_DEBOUNCE_SECONDS são coalescidas: só o texto mais recente é enviado.
+    """
+    key = (chat_id, message_id)
+
+    def fire():
+        with _edit_debounce_lock:
+            if _edit_debounce.get(key) is timer:
+                del _edit_debounce[key]
+        try:
+            _edit_message_text(text, chat_id, message_id, **kwargs)
+        except telebot.apihelper.ApiTelegramException as e:
+            logger.warning("Não foi possível editar a mensagem %s do chat %s: %s", message_id, chat_id, e)
+
+    timer = threading.Timer(_EDIT_DEBOUNCE_SECONDS, fire)
+    timer.daemon = True
+    with _edit_debounce_lock:
+        previous = _edit_debounce.get(key)
+        if previous:
+            previous.cancel()
+        _edit_debounce[key] = timer
+    timer.start()
+
+def is_admin(user_id):
+    """Verifica se um ID de usuário pertence a um administrador."""
+    return user_id in config.ADMIN_TELEGRAM_IDS_SET
+
 def register_admin_handlers(bot_instance):
     """
     Registra todos os handlers de comandos e callbacks relacionados ao admin.
     """
     global bot
     bot = bot_instance
+    bot.register_message_handler(handle_set_saldo_command, commands=['setsaldo'])
+    bot.register_message_handler(handle_admin_command, commands=['admin', 'adm'])
+    # Um único handler para todos os callbacks 'admin_*'; o roteamento é feito por dicionário.
+    bot.register_callback_query_handler(handle_admin_callback, func=lambda call: call.data.startswith("admin_"))
 
-    def is_admin(user_id):
-        """Verifica se um ID de usuário pertence a um administrador."""
-        return user_id in config.ADMIN_TELEGRAM_IDS
+def handle_set_saldo_command(message):
+    """Inicia o fluxo de alteração de saldo via comando."""
+    if not is_admin(message.from_user.id):
+        _reply_to(message, "❌ Acesso negado. Este comando é restrito.")
+        return
 
-    # ... (handlers de saque e lucro permanecem os mesmos) ...
+    # Pede o ID do usuário para o qual o saldo será alterado
+    msg = _reply_to(message, "👤 Por favor, envie o `ID do Telegram` do usuário para alterar o saldo.")
+    _start_setsaldo_flow(message.from_user.id, msg)
 
-    # <<< COMANDO NOVO ADICIONADO >>>
-    @bot.message_handler(commands=['setsaldo'])
-    def handle_set_saldo_command(message):
-        """Inicia o fluxo de alteração de saldo via comando."""
-        if not is_admin(message.from_user.id):
-            bot.reply_to(message, "❌ Acesso negado. Este comando é restrito.")
-            return
+def handle_admin_command(message):
+    """Exibe o painel de administração se o usuário for um admin."""
+    if not is_admin(message.from_user.id):
+        _reply_to(message, "❌ Acesso negado. Este comando é restrito.")
+        return
 
-        # Pede o ID do usuário para o qual o saldo será alterado
-        msg = bot.reply_to(message, "👤 Por favor, envie o `ID do Telegram` do usuário para alterar o saldo.")
-        bot.register_next_step_handler(msg, process_user_id_for_balance)
+    logger.info("👑 Admin %s acessou o painel.", message.from_user.id)
+    _send_message(message.chat.id, "⚙️ *Painel do Administrador*", reply_markup=_ADMIN_PANEL_MARKUP, parse_mode="Markdown")
 
-    @bot.message_handler(commands=['admin', 'adm'])
-    def handle_admin_command(message):
-        """Exibe o painel de administração se o usuário for um admin."""
-        if not is_admin(message.from_user.id):
-            bot.reply_to(message, "❌ Acesso negado. Este comando é restrito.")
-            return
+def handle_admin_view_actions(call):
+    """Exibe os saques pendentes ou o lucro acumulado com taxas."""
+    if not is_admin(call.from_user.id):
+        _answer_callback_query(call.id, "❌ Ação não permitida!", show_alert=True)
+        return
+    # Confirma o clique antes de qualquer acesso ao banco, para o botão não ficar "carregando"
+    _answer_callback_query(call.id)
 
-        logger.info(f"👑 Admin {message.from_user.id} acessou o painel.")
-        markup = InlineKeyboardMarkup(row_width=1)
-        btn_pending = InlineKeyboardButton("💰 Ver Saques Pendentes", callback_data="admin_view_pending")
-        btn_profit = InlineKeyboardButton("📈 Ver Lucro com Taxas", callback_data="admin_view_profit")
-        btn_manage_users = InlineKeyboardButton("👤 Administrar Saldo de Usuário", callback_data="admin_user_menu")
-        # <<< BOTÃO NOVO ADICIONADO >>>
-        btn_view_balances = InlineKeyboardButton("👥 Ver Saldos de Usuários", callback_data="admin_view_balances")
-        markup.add(btn_pending, btn_profit, btn_manage_users, btn_view_balances)
-        bot.send_message(message.chat.id, "⚙️ *Painel do Administrador*", reply_markup=markup, parse_mode="Markdown")
-        
-    # <<< HANDLER DE CALLBACK NOVO >>>
-    @bot.callback_query_handler(func=lambda call: call.data == "admin_view_balances")
-    def handle_view_balances(call):
-        """Busca e exibe todos os usuários com saldo > 0."""
-        if not is_admin(call.from_user.id):
-            bot.answer_callback_query(call.id, "❌ Ação não permitida!", show_alert=True)
-            return
+    match = _VIEW_RE.match(call.data)
+    if not match:
+        logger.error("Erro ao parsear callback_data: %s", call.data)
+        return
 
-        bot.answer_callback_query(call.id, "Buscando usuários com saldo...")
-        users_with_balance = database.get_users_with_balance()
+    action = match.group(1)
+    if action == "pending":
+        _send_pending_page(call, after_id=0)
+    elif action == "profit":
+        total_profit = database.calculate_profits()
+        _debounced_edit(f"📈 *Lucro Total com Taxas:*\n\n`R$ {total_profit:.2f}`", call.message.chat.id, call.message.message_id, parse_mode="Markdown")
 
-        if not users_with_balance:
-            bot.edit_message_text("✅ Nenhum usuário com saldo encontrado.", call.message.chat.id, call.message.message_id)
-            return
+def handle_pending_next(call):
+    """Envia a próxima página de saques pendentes (depois do último ID já enviado)."""
+    if not is_admin(call.from_user.id):
+        _answer_callback_query(call.id, "❌ Ação não permitida!", show_alert=True)
+        return
+    _answer_callback_query(call.id)
 
-        message_text = "👥 *Usuários com Saldo:*\n"
-        for user in users_with_balance:
-            username = f"(@{user['username']})" if user['username'] else ""
-            message_text += (
-                f"\n👤 *{user['first_name']}* {username}\n"
-                f"   - ID: `{user['telegram_id']}`\n"
-                f"   - Saldo: *R$ {user['balance']:.2f}*\n"
-            )
-        
-        # O Telegram tem um limite de 4096 caracteres por mensagem.
-        # Se a lista for muito grande, será necessário paginar.
-        # Para a maioria dos casos, isso será suficiente.
-        try:
-            bot.edit_message_text(message_text, call.message.chat.id, call.message.message_id, parse_mode="Markdown")
-        except telebot.apihelper.ApiTelegramException as e:
-            if "message is too long" in str(e):
-                bot.edit_message_text("⚠️ A lista de usuários é muito longa para ser exibida em uma única mensagem.", call.message.chat.id, call.message.message_id)
-
-    @bot.callback_query_handler(func=lambda call: call.data == "admin_user_menu")
-    def handle_admin_user_menu(call):
-        """Inicia o fluxo para administrar um usuário pelo menu."""
-        if not is_admin(call.from_user.id):
-            bot.answer_callback_query(call.id, "❌ Ação não permitida!", show_alert=True)
-            return
+    match = _PENDING_NEXT_RE.match(call.data)
+    if not match:
+        logger.error("Erro ao parsear callback_data: %s", call.data)
+        return
+    _send_pending_page(call, after_id=int(match.group(1)))
+
+def _send_pending_page(call, after_id):
+    """Edita o painel com o resumo e envia até PENDING_NOTIFY_LIMIT saques pendentes após `after_id`."""
+    pending_withdrawals = database.get_pending_withdrawals(limit=PENDING_NOTIFY_LIMIT, after_id=after_id)
+    if not pending_withdrawals:
+        text = "✅ Nenhum saque pendente no momento." if after_id == 0 else "✅ Não há mais saques pendentes."
+        _debounced_edit(text, call.message.chat.id, call.message.message_id)
+        return
 
-        msg = bot.edit_message_text(
-            "👤 *Administrar Saldo de Usuário*\n\n"
-            "Por favor, envie o `ID do Telegram` do usuário que você deseja gerenciar.",
-            call.message.chat.id, call.message.message_id, parse_mode="Markdown"
+    remaining = pending_withdrawals[0]['remaining']
+    header = f"📋 *{remaining} saque(s) pendente(s){' a partir daqui' if after_id else ''}.* Enviando {len(pending_withdrawals)}..."
+    markup = None
+    if remaining > len(pending_withdrawals):
+        markup = InlineKeyboardMarkup().add(InlineKeyboardButton(
+            "▶️ Próximos", callback_data=f"admin_pending_next_{pending_withdrawals[-1]['id']}"
+        ))
+    _debounced_edit(header, call.message.chat.id, call.message.message_id, parse_mode="Markdown", reply_markup=markup)
+    # Cada saque é uma mensagem com os próprios botões, que saem no ritmo do limite por chat
+    # (~1/s) na fila do admin; a página evita deixar o admin minutos esperando a lista terminar.
+    for trx in pending_withdrawals:
+        notify_admin_of_withdrawal_request(
+            trx['id'], trx['user_telegram_id'], trx['first_name'] or "N/A",
+            trx['amount'], trx['pix_key'], target_admin_id=call.from_user.id
         )
-        bot.register_next_step_handler(msg, process_user_id_for_balance)
 
-    def process_user_id_for_balance(message):
-        """Recebe o ID do usuário e pede o novo saldo."""
-        admin_id = message.from_user.id
-        if not is_admin(admin_id): return
+def handle_view_balances(call):
+    """Exibe, página por página, os usuários com saldo > 0."""
+    if not is_admin(call.from_user.id):
+        _answer_callback_query(call.id, "❌ Ação não permitida!", show_alert=True)
+        return
+    _answer_callback_query(call.id)
 
-        try:
-            target_user_id = int(message.text)
-        except (ValueError, TypeError):
-            bot.reply_to(message, "❌ ID inválido. Por favor, envie apenas o número. Tente novamente a partir do comando ou painel.")
-            return
-        
-        user_info = database.get_user_info(target_user_id)
-        if not user_info:
-            bot.reply_to(message, f"❌ Usuário com ID `{target_user_id}` não encontrado. Verifique o ID.")
-            return
+    match = _BALANCES_PAGE_RE.match(call.data)
+    offset = int(match.group(1)) if match else 0
+
+    # Busca um registro a mais apenas para saber se existe uma próxima página
+    users_with_balance = database.get_users_with_balance(limit=BALANCES_PAGE_SIZE + 1, offset=offset)
+    has_next = len(users_with_balance) > BALANCES_PAGE_SIZE
+    users_with_balance = users_with_balance[:BALANCES_PAGE_SIZE]
 
-        msg = bot.reply_to(
-            message,
-            f"✅ Usuário `{target_user_id}` (`{user_info.get('first_name', 'N/A')}`) encontrado.\n"
-            f"💰 Saldo atual: *R$ {user_info.get('balance', 0.00):.2f}*\n\n"
-            "Envie o *novo saldo* a ser definido (ex: `150.75`).",
-            parse_mode="Markdown"
+    if not users_with_balance:
+        _debounced_edit("✅ Nenhum usuário com saldo encontrado.", call.message.chat.id, call.message.message_id)
+        return
+
+    parts = [f"👥 *Usuários com Saldo* (página {offset // BALANCES_PAGE_SIZE + 1}):\n"]
+    for telegram_id, first_name, username, balance in users_with_balance:
+        username = f"(@{username})" if username else ""
+        parts.append(
+            f"\n👤 *{first_name}* {username}\n"
+            f"   - ID: `{telegram_id}`\n"
+            f"   - Saldo: *R$ {balance:.2f}*\n"
         )
-        bot.register_next_step_handler(msg, process_new_balance, target_user_id)
 
-    def process_new_balance(message, target_user_id):
-        """Recebe e atualiza o novo saldo do usuário."""
-        admin_id = message.from_user.id
-        if not is_admin(admin_id): return
-        
+    nav_buttons = []
+    if offset > 0:
+        nav_buttons.append(InlineKeyboardButton("◀️ Anterior", callback_data=f"admin_balances_page_{max(offset - BALANCES_PAGE_SIZE, 0)}"))
+    if has_next:
+        nav_buttons.append(InlineKeyboardButton("▶️ Próxima", callback_data=f"admin_balances_page_{offset + BALANCES_PAGE_SIZE}"))
+    markup = InlineKeyboardMarkup(row_width=2).add(*nav_buttons) if nav_buttons else None
+
+    # Cada página é limitada para caber no limite de 4096 caracteres por mensagem do Telegram.
+    _debounced_edit("".join(parts), call.message.chat.id, call.message.message_id, parse_mode="Markdown", reply_markup=markup)
+
+def handle_admin_user_menu(call):
+    """Inicia o fluxo para administrar um usuário pelo menu."""
+    if not is_admin(call.from_user.id):
+        _answer_callback_query(call.id, "❌ Ação não permitida!", show_alert=True)
+        return
+    _answer_callback_query(call.id)
+
+    msg = _edit_message_text(
+        "👤 *Administrar Saldo de Usuário*\n\n"
+        "Por favor, envie o `ID do Telegram` do usuário que você deseja gerenciar.",
+        call.message.chat.id, call.message.message_id, parse_mode="Markdown"
+    )
+    _start_setsaldo_flow(call.from_user.id, msg)
+
+def _start_setsaldo_flow(admin_id, prompt_message):
+    """Abre (ou reinicia) o fluxo de alteração de saldo de um admin."""
+    _PENDING_SETSALDO[admin_id] = {"stage": "await_user"}
+    bot.register_next_step_handler(prompt_message, process_setsaldo_step)
+
+def process_setsaldo_step(message):
+    """Encaminha a resposta do admin para a etapa atual do fluxo de alteração de saldo."""
+    admin_id = message.from_user.id
+    if not is_admin(admin_id): return
+
+    # Cada etapa consome o estado; só volta a existir se o fluxo avançar para a próxima etapa.
+    state = _PENDING_SETSALDO.pop(admin_id, None)
+    if state is None:
+        return
+    if state["stage"] == "await_user":
+        process_user_id_for_balance(message)
+    elif state["stage"] == "await_balance":
+        process_new_balance(message, state["target_user_id"])
+
+def process_user_id_for_balance(message):
+    """Recebe o ID do usuário e pede o novo saldo."""
+    admin_id = message.from_user.id
+
+    try:
+        target_user_id = int(message.text)
+    except (ValueError, TypeError):
+        _reply_to(message, "❌ ID inválido. Por favor, envie apenas o número. Tente novamente a partir do comando ou painel.")
+        return
+
+    user_info = database.get_user_info(target_user_id)
+    if not user_info:
+        _reply_to(message, f"❌ Usuário com ID `{target_user_id}` não encontrado. Verifique o ID.")
+        return
+
+    msg = _reply_to(
+        message,
+        f"✅ Usuário `{target_user_id}` (`{user_info.get('first_name', 'N/A')}`) encontrado.\n"
+        f"💰 Saldo atual: *R$ {user_info.get('balance', 0.00):.2f}*\n\n"
+        "Envie o *novo saldo* a ser definido (ex: `150.75`).",
+        parse_mode="Markdown"
+    )
+    _PENDING_SETSALDO[admin_id] = {"stage": "await_balance", "target_user_id": target_user_id}
+    bot.register_next_step_handler(msg, process_setsaldo_step)
+
+def process_new_balance(message, target_user_id):
+    """Recebe e atualiza o novo saldo do usuário."""
+    admin_id = message.from_user.id
+
+    try:
+        # Substitui vírgula por ponto para aceitar ambos formatos
+        new_balance = float(message.text.replace(',', '.'))
+        if new_balance < 0:
+            _reply_to(message, "❌ O saldo não pode ser negativo. Operação cancelada.")
+            return
+    except (ValueError, TypeError):
+        _reply_to(message, "❌ Valor inválido. Envie um número (ex: `25.50`). Operação cancelada.")
+        return
+
+    logger.info("👑 Admin %s está definindo o saldo do usuário %s para R$%.2f.", admin_id, target_user_id, new_balance)
+
+    if database.admin_set_balance(target_user_id, new_balance):
+        _reply_to(message, f"✅ Sucesso! O saldo de `{target_user_id}` foi definido para *R$ {new_balance:.2f}*.", parse_mode="Markdown")
+        logger.info("✅ Saldo de %s definido para R$%.2f por %s.", target_user_id, new_balance, admin_id)
+
         try:
-            # Substitui vírgula por ponto para aceitar ambos formatos
-            new_balance = float(message.text.replace(',', '.'))
-            if new_balance < 0:
-                bot.reply_to(message, "❌ O saldo não pode ser negativo. Operação cancelada.")
-                return
-        except (ValueError, TypeError):
-            bot.reply_to(message, "❌ Valor inválido. Envie um número (ex: `25.50`). Operação cancelada.")
+            _send_message(target_user_id, f"ℹ️ *Aviso Administrativo:*\nSeu saldo foi ajustado para *R$ {new_balance:.2f}*.", parse_mode="Markdown")
+        except Exception as e:
+            logger.warning("Não foi possível notificar %s sobre a alteração de saldo: %s", target_user_id, e)
+    else:
+        _reply_to(message, f"❌ Erro! Não foi possível atualizar o saldo para `{target_user_id}`. Verifique os logs.")
+        logger.error("Falha ao definir saldo para %s por %s.", target_user_id, admin_id)
+
+# -------------------------------------
+# HANDLER PARA AÇÕES DE SAQUE (APROVAR/REJEITAR)
+# -------------------------------------
+def handle_admin_withdrawal_action(call):
+    """Processa a aprovação ou rejeição de uma solicitação de saque."""
+    admin_id = call.from_user.id
+    if not is_admin(admin_id):
+        _answer_callback_query(call.id, "❌ Ação não permitida!", show_alert=True)
+        return
+    # O callback só pode ser respondido uma vez: a partir daqui o retorno ao admin é feito editando a mensagem
+    _answer_callback_query(call.id)
+
+    match = _WITHDRAW_RE.match(call.data)
+    if not match:
+        logger.error("Erro ao parsear callback_data: %s", call.data)
+        return
+    action, transaction_id = match.group(1), int(match.group(2))
+
+    transaction = database.get_transaction_details(transaction_id)
+    if not transaction or transaction['status'] != config.STATUS_EM_ANALISE:
+        _edit_message_text("Esta solicitação já foi tratada por outro administrador ou não é mais válida.", call.message.chat.id, call.message.message_id, reply_markup=None)
+        return
+
+    user_telegram_id = transaction['user_telegram_id']
+    original_amount = transaction['amount']
+
+    if action == "approve":
+        # Só um admin consegue mover o saque para EM ANDAMENTO; cliques concorrentes param aqui.
+        if not database.try_claim_transaction(transaction_id, config.STATUS_EM_ANALISE, config.STATUS_EM_ANDAMENTO):
+            _edit_message_text("Esta solicitação já foi tratada por outro administrador ou não é mais válida.", call.message.chat.id, call.message.message_id, reply_markup=None)
             return
 
-        logger.info(f"👑 Admin {admin_id} está definindo o saldo do usuário {target_user_id} para R${new_balance:.2f}.")
-        
-        if database.admin_set_balance(target_user_id, new_balance):
-            bot.reply_to(message, f"✅ Sucesso! O saldo de `{target_user_id}` foi definido para *R$ {new_balance:.2f}*.", parse_mode="Markdown")
-            logger.info(f"✅ Saldo de {target_user_id} definido para R${new_balance:.2f} por {admin_id}.")
-            
-            try:
-                bot.send_message(target_user_id, f"ℹ️ *Aviso Administrativo:*\nSeu saldo foi ajustado para *R$ {new_balance:.2f}*.", parse_mode="Markdown")
-            except Exception as e:
-                logger.warning(f"Não foi possível notificar {target_user_id} sobre a alteração de saldo: {e}")
+        logger.info("👑 Admin %s iniciou APROVAÇÃO do saque %s no valor de R$%.2f.", admin_id, transaction_id, original_amount)
+        _edit_message_text(f"⏳ Processando pagamento para saque ID `{transaction_id}` (R${original_amount:.2f})...", call.message.chat.id, call.message.message_id, reply_markup=None)
+
+        # O payout é uma chamada HTTP lenta: roda no pool e o resultado é tratado no callback,
+        # liberando a thread do handler para outros admins/usuários.
+        chat_id, message_id = call.message.chat.id, call.message.message_id
+        future = _PAYOUT_POOL.submit(
+            pay.process_payout,
+            transaction_id_local=transaction_id,
+            amount=original_amount,
+            pix_key_receiver=transaction['pix_key'],
+            description=f"Saque {config.NOME_BOT} ID {transaction_id}"
+        )
+        future.add_done_callback(
+            lambda f: _handle_payout_result(f, transaction_id, user_telegram_id, original_amount, admin_id, chat_id, message_id)
+        )
+
+    elif action == "reject":
+        logger.info("👑 Admin %s iniciou REJEIÇÃO do saque %s.", admin_id, transaction_id)
+        fee_amount = database.get_fee_for_withdrawal(transaction_id)
+        total_to_refund = original_amount + fee_amount
+
+        admin_notes = f"Rejeitado pelo administrador {admin_id}."
+        if database.reject_withdrawal(transaction_id, user_telegram_id, total_to_refund, admin_notes):
+            _edit_message_text(f"🚫 Saque ID `{transaction_id}` *RECUSADO*. O valor de R$ {total_to_refund:.2f} foi estornado com sucesso ao usuário.", call.message.chat.id, call.message.message_id, reply_markup=None)
+            _send_message(user_telegram_id, f"❌ Sua solicitação de saque de R${original_amount:.2f} (ID: `{transaction_id}`) foi *RECUSADA*. O valor total debitado de R${total_to_refund:.2f} foi devolvido integralmente ao seu saldo.")
+            logger.info("🚫 Saque %s REJEITADO pelo admin %s. Valor estornado.", transaction_id, admin_id)
         else:
-            bot.reply_to(message, f"❌ Erro! Não foi possível atualizar o saldo para `{target_user_id}`. Verifique os logs.")
-            logger.error(f"Falha ao definir saldo para {target_user_id} por {admin_id}.")
-
-    # -------------------------------------
-    # HANDLER PARA AÇÕES DE SAQUE (APROVAR/REJEITAR)
-    # -------------------------------------
-    @bot.callback_query_handler(func=lambda call: call.data.startswith("admin_withdraw_"))
-    def handle_admin_withdrawal_action(call):
-        """Processa a aprovação ou rejeição de uma solicitação de saque."""
-        admin_id = call.from_user.id
-        if not is_admin(admin_id):
-            bot.answer_callback_query(call.id, "❌ Ação não permitida!", show_alert=True)
-            return
+            # A recusa e o estorno são atômicos e condicionados ao status: se falharam, nada foi gravado
+            # (o saque já foi tratado por outro admin ou houve erro no banco).
+            logger.error("❌ Falha ao recusar o saque %s (Admin: %s). Nenhuma alteração foi gravada.", transaction_id, admin_id)
+            _edit_message_text(f"⚠️ Não foi possível recusar o saque ID `{transaction_id}`: ele já foi tratado por outro administrador ou ocorreu um erro. Nenhuma alteração foi feita.", call.message.chat.id, call.message.message_id, reply_markup=None)
 
+def _handle_payout_result(future, transaction_id, user_telegram_id, original_amount, admin_id, chat_id, message_id):
+    """Finaliza um saque aprovado quando o payout (executado no _PAYOUT_POOL) termina."""
+    try:
         try:
-            _, _, action, transaction_id_str = call.data.split("_")
-            transaction_id = int(transaction_id_str)
-        except ValueError:
-            logger.error(f"Erro ao parsear callback_data: {call.data}")
-            bot.answer_callback_query(call.id, "❌ Erro no formato do comando.", show_alert=True)
-            return
+            payout_result = future.result()
+        except Exception as e:
+            logger.error("💥 Exceção no payout do saque %s: %s", transaction_id, e, exc_info=True)
+            payout_result = {'success': False, 'message': 'Erro crítico na comunicação com o gateway.'}
 
-        transaction = database.get_transaction_details(transaction_id)
-        if not transaction or transaction['status'] != config.STATUS_EM_ANALISE:
-            bot.answer_callback_query(call.id, "⚠️ Transação não encontrada ou já processada.", show_alert=True)
-            bot.edit_message_text("Esta solicitação já foi tratada por outro administrador ou não é mais válida.", call.message.chat.id, call.message.message_id, reply_markup=None)
-            return
-        
-        user_telegram_id = transaction['user_telegram_id']
-        original_amount = transaction['amount']
-
-        if action == "approve":
-            logger.info(f"👑 Admin {admin_id} iniciou APROVAÇÃO do saque {transaction_id} no valor de R${original_amount:.2f}.")
-            bot.answer_callback_query(call.id, "⏳ Processando pagamento...")
-            bot.edit_message_text(f"⏳ Processando pagamento para saque ID `{transaction_id}` (R${original_amount:.2f})...", call.message.chat.id, call.message.message_id, reply_markup=None)
-            database.update_transaction_status(transaction_id, config.STATUS_EM_ANDAMENTO)
-            
-            payout_result = pay.process_payout(
-                transaction_id_local=transaction_id,
-                amount=original_amount,
-                pix_key_receiver=transaction['pix_key'],
-                description=f"Saque {config.NOME_BOT} ID {transaction_id}"
-            )
-
-            if payout_result.get('success'):
-                payout_id = payout_result.get('payout_id')
-                database.update_transaction_status(transaction_id, config.STATUS_CONCLUIDO, mp_id=payout_id)
-                bot.send_message(user_telegram_id, f"✅ Seu saque de R${original_amount:.2f} foi *APROVADO* e o pagamento foi enviado!\nID da transação: `{transaction_id}`")
-                bot.edit_message_text(f"✅ Saque ID `{transaction_id}` (R${original_amount:.2f}) *APROVADO E PAGO*.\nID do Gateway: `{payout_id}`", call.message.chat.id, call.message.message_id)
-                logger.info(f"✅ Saque {transaction_id} APROVADO e pago pelo admin {admin_id}.")
-            else:
-                error_msg = payout_result.get('message', 'Erro desconhecido')
-                database.update_transaction_status(transaction_id, config.STATUS_FALHA_PAGAMENTO, admin_notes=f"Admin {admin_id} tentou aprovar. Gateway: {error_msg}")
-                fee_amount = database.get_fee_for_withdrawal(transaction_id)
-                total_to_refund = original_amount + fee_amount
-                
-                if database.update_balance(user_telegram_id, total_to_refund):
-                    bot.send_message(user_telegram_id, f"⚠️ *Atenção:* Ocorreu uma falha no envio do seu saque de R${original_amount:.2f} (ID: `{transaction_id}`). O valor total de *R${total_to_refund:.2f}* foi estornado ao seu saldo. Por favor, tente novamente mais tarde ou contate o suporte.")
-                    bot.edit_message_text(f"❌ *FALHA NO PAGAMENTO* para saque ID `{transaction_id}`.\nMotivo: {error_msg}\n\n*O valor total (saque + taxa) foi estornado ao saldo do usuário.*", call.message.chat.id, call.message.message_id)
-                    logger.error(f"❌ Falha no pagamento do saque {transaction_id} (Admin: {admin_id}). Valor estornado ao usuário.")
-                else:
-                    logger.critical(f"🆘 CRÍTICO: FALHA NO PAGAMENTO do saque {transaction_id} E FALHA AO ESTORNAR o saldo para o usuário {user_telegram_id}. INTERVENÇÃO MANUAL URGENTE!")
-                    bot.edit_message_text(f"🆘 *CRÍTICO:* Falha no pagamento para saque ID `{transaction_id}` E *FALHA AO ESTORNAR O SALDO*. Contate o suporte técnico imediatamente!", call.message.chat.id, call.message.message_id)
-
-        elif action == "reject":
-            logger.info(f"👑 Admin {admin_id} iniciou REJEIÇÃO do saque {transaction_id}.")
-            bot.answer_callback_query(call.id, "🚫 Rejeitando e estornando valor...")
+        if payout_result.get('success'):
+            payout_id = payout_result.get('payout_id')
+            database.update_transaction_status(transaction_id, config.STATUS_CONCLUIDO, mp_id=payout_id)
+            _send_message(user_telegram_id, f"✅ Seu saque de R${original_amount:.2f} foi *APROVADO* e o pagamento foi enviado!\nID da transação: `{transaction_id}`")
+            _edit_message_text(f"✅ Saque ID `{transaction_id}` (R${original_amount:.2f}) *APROVADO E PAGO*.\nID do Gateway: `{payout_id}`", chat_id, message_id)
+            logger.info("✅ Saque %s APROVADO e pago pelo admin %s.", transaction_id, admin_id)
+        else:
+            error_msg = payout_result.get('message', 'Erro desconhecido')
             fee_amount = database.get_fee_for_withdrawal(transaction_id)
             total_to_refund = original_amount + fee_amount
-            
-            if database.update_balance(user_telegram_id, total_to_refund):
-                admin_notes = f"Rejeitado pelo administrador {admin_id}."
-                database.update_transaction_status(transaction_id, config.STATUS_RECUSADO, admin_notes=admin_notes)
-                bot.edit_message_text(f"🚫 Saque ID `{transaction_id}` *RECUSADO*. O valor de R$ {total_to_refund:.2f} foi estornado com sucesso ao usuário.", call.message.chat.id, call.message.message_id, reply_markup=None)
-                bot.send_message(user_telegram_id, f"❌ Sua solicitação de saque de R${original_amount:.2f} (ID: `{transaction_id}`) foi *RECUSADA*. O valor total debitado de R${total_to_refund:.2f} foi devolvido integralmente ao seu saldo.")
-                logger.info(f"🚫 Saque {transaction_id} REJEITADO pelo admin {admin_id}. Valor estornado.")
+            admin_notes = f"Admin {admin_id} tentou aprovar. Gateway: {error_msg}"
+
+            if database.reject_withdrawal(transaction_id, user_telegram_id, total_to_refund, admin_notes, new_status=config.STATUS_FALHA_PAGAMENTO, expected_status=config.STATUS_EM_ANDAMENTO):
+                _send_message(user_telegram_id, f"⚠️ *Atenção:* Ocorreu uma falha no envio do seu saque de R${original_amount:.2f} (ID: `{transaction_id}`). O valor total de *R${total_to_refund:.2f}* foi estornado ao seu saldo. Por favor, tente novamente mais tarde ou contate o suporte.")
+                _edit_message_text(f"❌ *FALHA NO PAGAMENTO* para saque ID `{transaction_id}`.\nMotivo: {error_msg}\n\n*O valor total (saque + taxa) foi estornado ao saldo do usuário.*", chat_id, message_id)
+                logger.error("❌ Falha no pagamento do saque %s (Admin: %s). Valor estornado ao usuário.", transaction_id, admin_id)
             else:
-                logger.critical(f"🆘 CRÍTICO: FALHA AO ESTORNAR saldo para o saque rejeitado {transaction_id} (Admin: {admin_id}). INTERVENÇÃO MANUAL URGENTE!")
-                bot.edit_message_text(f"🆘 *CRÍTICO:* Saque ID `{transaction_id}` rejeitado, MAS FALHOU AO ESTORNAR O SALDO. Contate o suporte técnico imediatamente!", call.message.chat.id, call.message.message_id)
+                logger.critical("🆘 CRÍTICO: FALHA NO PAGAMENTO do saque %s E FALHA AO ESTORNAR o saldo para o usuário %s. INTERVENÇÃO MANUAL URGENTE!", transaction_id, user_telegram_id)
+                _edit_message_text(f"🆘 *CRÍTICO:* Falha no pagamento para saque ID `{transaction_id}` E *FALHA AO ESTORNAR O SALDO*. Contate o suporte técnico imediatamente!", chat_id, message_id)
+    except Exception as e:
+        logger.critical("🆘 Erro ao finalizar o saque %s após o payout: %s", transaction_id, e, exc_info=True)
+
+def handle_admin_callback(call):
+    """Despacha um callback 'admin_<grupo>_<ação>...' para o handler correspondente."""
+    handler = _ADMIN_DISPATCH.get("_".join(call.data.split("_", 3)[1:3]))
+    if handler is None:
+        # Callback desconhecido/malformado: só confirma o recebimento para o cliente não ficar carregando
+        logger.warning("Callback administrativo desconhecido: %s", call.data)
+        _answer_callback_query(call.id)
+        return
+    handler(call)
 
+_ADMIN_DISPATCH = {
+    "view_pending": handle_admin_view_actions,
+    "view_profit": handle_admin_view_actions,
+    "view_balances": handle_view_balances,
+    "balances_page": handle_view_balances,
+    "pending_next": handle_pending_next,
+    "user_menu": handle_admin_user_menu,
+    "withdraw_approve": handle_admin_withdrawal_action,
+    "withdraw_reject": handle_admin_withdrawal_action,
+}
+
+def _withdraw_markup(transaction_id):
+    """Monta o teclado de aprovar/recusar; apenas o callback_data depende da transação."""
+    return InlineKeyboardMarkup(row_width=2).add(
+        InlineKeyboardButton(_BTN_APPROVE_TEXT, callback_data=f"admin_withdraw_approve_{transaction_id}"),
+        InlineKeyboardButton(_BTN_REJECT_TEXT, callback_data=f"admin_withdraw_reject_{transaction_id}"),
+    )
 
 def notify_admin_of_withdrawal_request(transaction_id, user_telegram_id, user_first_name, amount, pix_key, target_admin_id=None):
     """
-    Envia uma mensagem de notificação para os administradores sobre um novo saque.
-    Se target_admin_id for especificado, envia apenas para ele.
+    Enfileira uma mensagem de notificação para os administradores sobre um novo saque
+    e retorna sem esperar o envio. Se target_admin_id for especificado, envia apenas para ele.
     """
     admin_list = [target_admin_id] if target_admin_id else config.ADMIN_TELEGRAM_IDS
     if not admin_list:
-        logger.warning(f"⚠️ Nenhum administrador para notificar sobre o saque {transaction_id}.")
+        logger.warning("⚠️ Nenhum administrador para notificar sobre o saque %s.", transaction_id)
         return
 
-    markup = InlineKeyboardMarkup(row_width=2)
-    btn_approve = InlineKeyboardButton("✅ Aprovar Pagamento", callback_data=f"admin_withdraw_approve_{transaction_id}")
-    btn_reject = InlineKeyboardButton("❌ Recusar e Estornar", callback_data=f"admin_withdraw_reject_{transaction_id}")
-    markup.add(btn_approve, btn_reject)
-
-    message_text = (
-        f"⚠️ *Nova Solicitação de Saque Pendente:*\n\n"
-        f"👤 *Usuário:* {user_first_name} (`{user_telegram_id}`)\n"
-        f"🆔 *ID da Transação:* `{transaction_id}`\n\n"
-        f"💸 *Valor a Pagar (Líquido):* `R$ {amount:.2f}`\n"
-        f"🔑 *Chave PIX:* `{pix_key}`"
+    markup = _withdraw_markup(transaction_id)
+
+    message_text = _NOTIFY_TEMPLATE.format(
+        name=user_first_name, uid=user_telegram_id, tid=transaction_id, amount=amount, pix=pix_key
     )
 
+    # Cada envio entra na fila do chat do admin no throttle (ordem preservada por admin, sem
+    # atrasar os outros chats); falhas de envio são registradas pelo próprio throttle.
     for admin_id in admin_list:
-        try:
-            bot.send_message(admin_id, message_text, reply_markup=markup)
-            logger.info(f"📬 Notificação de saque {transaction_id} enviada ao admin ID: {admin_id}.")
-        except Exception as e:
-            logger.error(f"❌ Erro ao enviar notificação de saque {transaction_id} para admin ID {admin_id}: {e}")
\ No newline at end of file
+        throttle.submit(bot.send_message, admin_id, message_text, chat_id=admin_id, reply_markup=markup)
+    logger.info("📬 Notificação de saque %s enfileirada para %s admin(s).", transaction_id, len(admin_list))
\ No newline at end of file
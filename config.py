@@ -24,6 +24,20 @@ MERCADOPAGO_ACCESS_TOKEN = os.getenv("MERCADOPAGO_ACCESS_TOKEN")
 # URL de conexão do banco de dados PostgreSQL, fornecida pela Railway.
 DATABASE_URL = os.getenv("DATABASE_URL")
 
+# Quantidade de threads que executam os handlers do bot em paralelo. Um handler esperando o
+# banco ou o Mercado Pago não bloqueia os demais usuários enquanto houver threads livres.
+# Mantenha abaixo do tamanho do pool de conexões do banco (database.DB_POOL_MAX).
+BOT_NUM_THREADS = int(os.getenv("BOT_NUM_THREADS", "8"))
+
+# URL pública do servidor web (webhook_server.py), ex: "https://flexipay.up.railway.app".
+# O Telegram entrega as atualizações do bot em <WEBHOOK_URL>/webhook/telegram.
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+
+# Segredo enviado pelo Telegram no cabeçalho X-Telegram-Bot-Api-Secret-Token de cada atualização.
+# Obrigatório: sem ele a rota /webhook/telegram recusa tudo, pois qualquer um que conheça a URL
+# poderia forjar atualizações (inclusive em nome de um admin). Use 1-256 caracteres A-Z, a-z, 0-9, _ e -.
+TELEGRAM_WEBHOOK_SECRET = os.getenv("TELEGRAM_WEBHOOK_SECRET")
+
 # Define se o bot está em modo de produção. Afeta logs e avisos.
 # Defina como "true" no seu ambiente de produção.
 PRODUCTION = os.getenv("PRODUCTION", "False").lower() == "true"
@@ -42,6 +56,9 @@ if admin_ids_str:
     except ValueError:
         print("⚠️ ERRO: ADMIN_TELEGRAM_IDS no arquivo .env contém um valor inválido. Use números inteiros separados por vírgula.")
 
+# Versão em conjunto para verificações de permissão em O(1) a cada mensagem/callback.
+ADMIN_TELEGRAM_IDS_SET = frozenset(ADMIN_TELEGRAM_IDS)
+
 
 # =============================================
 # 📊 CONFIGURAÇÕES FINANCEIRAS
@@ -59,6 +76,9 @@ TAXA_SAQUE_FIXA = 3.50
 LIMITE_MINIMO_DEPOSITO = 7.50
 LIMITE_MAXIMO_DEPOSITO = 1000.00
 
+# Por quantos segundos o saldo de um usuário pode ser servido do cache em memória.
+BALANCE_CACHE_TTL = float(os.getenv("BALANCE_CACHE_TTL", "15"))
+
 
 # =============================================
 # 🏷️ STATUS DE TRANSAÇÕES (Uso interno)
@@ -112,6 +132,13 @@ MSG_COMANDOS_BASE = (
     "`/canal` - Entrar no nosso canal."
 )
 
+# Resposta do /start, montada uma única vez; o handler só preenche nome e saldo com .format()
+WELCOME_TEMPLATE = (
+    "Olá, *{name}*!\n"
+    "Seu saldo atual é de *R$ {saldo:.2f}*.\n\n"
+    "👇 Escolha uma opção abaixo para começar:"
+)
+
 
 # =============================================
 # ❗️ VALIDAÇÕES FINAIS (Garante que o bot possa iniciar)
@@ -125,6 +152,14 @@ if not DATABASE_URL and PRODUCTION:
 elif not DATABASE_URL:
     print("AVISO: DATABASE_URL não configurada. O bot não conseguirá se conectar ao banco de dados.")
 
+if not WEBHOOK_URL and PRODUCTION:
+    print("AVISO: WEBHOOK_URL não configurada. O Telegram não saberá para onde enviar as atualizações do bot.")
+
+if not TELEGRAM_WEBHOOK_SECRET and PRODUCTION:
+    raise ValueError("FATAL: TELEGRAM_WEBHOOK_SECRET não configurado no ambiente de produção.")
+elif not TELEGRAM_WEBHOOK_SECRET:
+    print("AVISO: TELEGRAM_WEBHOOK_SECRET não configurado. O webhook do Telegram recusará todas as atualizações.")
+
 if not MERCADOPAGO_ACCESS_TOKEN and PRODUCTION:
     print("AVISO: Token do Mercado Pago não configurado. Funcionalidades de pagamento estarão desativadas.")
 
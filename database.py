@@ -6,39 +6,316 @@ Responsável por todas as interações com o banco de dados PostgreSQL.
 Inclui criação de tabelas, CRUD de usuários e transações.
 """
 import psycopg2
-from psycopg2.extras import DictCursor
+from psycopg2.extras import DictCursor, execute_values
+from psycopg2.pool import ThreadedConnectionPool
 import logging
-from datetime import datetime
+import threading
+import time
+from contextlib import contextmanager
+from decimal import Decimal, ROUND_HALF_UP
 import config
 
 logger = logging.getLogger(__name__)
 
-def get_db_connection():
+# Valores monetários são NUMERIC(12,2) no banco e Decimal no Python (sem erro de arredondamento de float)
+_CENTS = Decimal("0.01")
+ZERO = Decimal("0.00")
+
+def to_money(value):
+    """Converte um valor (float, int, str ou Decimal) para Decimal com 2 casas, arredondando meio centavo para cima."""
+    return Decimal(str(value)).quantize(_CENTS, rounding=ROUND_HALF_UP)
+
+# =============================================
+# 📜 SQL DAS CONSULTAS MAIS FREQUENTES DO PAINEL
+# =============================================
+# Textos fixos (sem montagem dinâmica de colunas): a mesma string é enviada a cada chamada.
+# Cada consulta traz só as colunas que os chamadores usam (nada de SELECT * com admin_notes etc.).
+# As leituras mais quentes são preparadas uma vez em cada conexão do pool (ver db()): o PostgreSQL
+# faz parse e planejamento só no PREPARE e as chamadas seguintes enviam apenas o EXECUTE.
+_PREPARED_STATEMENTS = (
+    "PREPARE stmt_get_balance(BIGINT) AS SELECT balance FROM users WHERE telegram_id = $1",
+    "PREPARE stmt_get_user_info(BIGINT) AS SELECT telegram_id, username, first_name, balance FROM users WHERE telegram_id = $1",
+    "PREPARE stmt_get_transaction(INTEGER) AS "
+    "SELECT id, user_telegram_id, type, amount, status, pix_key FROM transactions WHERE id = $1",
+    # Saques pendentes em ordem de chegada, paginados por keyset: $2 é o último ID já exibido (0 = início)
+    # e $3 o tamanho da página (NULL = todos). `remaining` conta os pendentes a partir desta página.
+    "PREPARE stmt_get_pending_withdrawals(TEXT, INTEGER, INTEGER) AS "
+    "SELECT t.id, t.user_telegram_id, t.amount, t.pix_key, t.created_at, u.first_name, "
+    "count(*) OVER () AS remaining FROM transactions t "
+    "LEFT JOIN users u ON u.telegram_id = t.user_telegram_id "
+    "WHERE t.type = 'WITHDRAWAL' AND t.status = $1 "
+    "AND ($2 = 0 OR (t.created_at, t.id) > (SELECT created_at, id FROM transactions WHERE id = $2)) "
+    "ORDER BY t.created_at, t.id LIMIT $3",
+)
+_SQL_GET_BALANCE = "EXECUTE stmt_get_balance(%s)"
+_SQL_GET_USER_INFO = "EXECUTE stmt_get_user_info(%s)"
+_SQL_GET_TRANSACTION = "EXECUTE stmt_get_transaction(%s)"
+_SQL_GET_PENDING_WITHDRAWALS = "EXECUTE stmt_get_pending_withdrawals(%s, %s, %s)"
+_SQL_CLAIM_TRANSACTION = "UPDATE transactions SET status = %s, updated_at = NOW() WHERE id = %s AND status = %s"
+# Colunas gravadas pelo INSERT de transações, sempre na mesma ordem (created_at/updated_at vêm do DEFAULT)
+_TRANSACTION_COLUMNS = (
+    'user_telegram_id', 'type', 'amount', 'status', 'pix_key',
+    'mercado_pago_id', 'admin_notes', 'related_transaction_id',
+)
+_SQL_INSERT_TRANSACTION = (
+    f"INSERT INTO transactions ({', '.join(_TRANSACTION_COLUMNS)}) "
+    f"VALUES ({', '.join(['%s'] * len(_TRANSACTION_COLUMNS))}) RETURNING id"
+)
+_SQL_INSERT_TRANSACTIONS_BATCH = f"INSERT INTO transactions ({', '.join(_TRANSACTION_COLUMNS)}) VALUES %s RETURNING id"
+# Cria ou atualiza o usuário e devolve o saldo; xmax = 0 só na linha recém-inserida
+_SQL_UPSERT_USER_RETURNING_BALANCE = (
+    "INSERT INTO users (telegram_id, username, first_name, balance) VALUES (%s, %s, %s, 0.00) "
+    "ON CONFLICT (telegram_id) DO UPDATE SET username = EXCLUDED.username, first_name = EXCLUDED.first_name "
+    "RETURNING balance, (xmax = 0) AS inserted"
+)
+# Dados do /carteira em um único round trip: cria o usuário só se ele não existir (DO NOTHING:
+# usuário existente não gera escrita), lê o saldo e a data da última transação.
+# Dentro da mesma instrução o SELECT em users não enxerga a linha recém-inserida, então só
+# uma das partes do UNION ALL devolve linha.
+_SQL_WALLET_SNAPSHOT = (
+    "WITH ins AS ("
+    "  INSERT INTO users (telegram_id, username, first_name, balance) VALUES (%s, %s, %s, 0.00)"
+    "  ON CONFLICT (telegram_id) DO NOTHING RETURNING balance"
+    "), u AS ("
+    "  SELECT balance, TRUE AS inserted FROM ins"
+    "  UNION ALL"
+    "  SELECT balance, FALSE FROM users WHERE telegram_id = %s"
+    ") "
+    "SELECT u.balance, u.inserted, "
+    "(SELECT updated_at FROM transactions WHERE user_telegram_id = %s ORDER BY updated_at DESC LIMIT 1) "
+    "FROM u LIMIT 1"
+)
+# Crédito/débito atômico: só altera se o saldo resultante não ficar negativo
+_SQL_UPDATE_BALANCE = (
+    "UPDATE users SET balance = balance + %s "
+    "WHERE telegram_id = %s AND balance + %s >= 0 RETURNING balance"
+)
+# mercado_pago_id/admin_notes só são alterados quando informados (NULL mantém o valor atual)
+_SQL_UPDATE_TRANSACTION_STATUS = (
+    "UPDATE transactions SET status = %s, updated_at = NOW(), "
+    "mercado_pago_id = COALESCE(%s, mercado_pago_id), admin_notes = COALESCE(%s, admin_notes) "
+    "WHERE id = %s"
+)
+# Saque e sua taxa em uma única instrução; a taxa aponta para o ID do saque recém-criado
+_SQL_INSERT_WITHDRAWAL_WITH_FEE = (
+    "WITH w AS ("
+    "  INSERT INTO transactions (user_telegram_id, type, amount, status, pix_key)"
+    "  VALUES (%s, 'WITHDRAWAL', %s, %s, %s) RETURNING id, user_telegram_id"
+    ") "
+    "INSERT INTO transactions (user_telegram_id, type, amount, status, admin_notes, related_transaction_id) "
+    "SELECT user_telegram_id, 'FEE', %s, %s, 'Taxa referente ao saque ID ' || id, id FROM w "
+    "RETURNING related_transaction_id"
+)
+# Confirmação de depósito em uma ida ao banco: marca como pago (só se ainda pendente), credita o
+# valor líquido e grava a taxa. Se o depósito não estava pendente, nenhuma das três alterações acontece.
+_SQL_CONFIRM_DEPOSIT = (
+    "WITH tx AS ("
+    "  UPDATE transactions SET status = %s, updated_at = NOW() WHERE id = %s AND status = %s"
+    "  RETURNING id, user_telegram_id"
+    "), credit AS ("
+    "  UPDATE users SET balance = balance + %s FROM tx WHERE users.telegram_id = tx.user_telegram_id"
+    "  RETURNING users.balance"
+    "), fee AS ("
+    "  INSERT INTO transactions (user_telegram_id, type, amount, status, admin_notes, related_transaction_id)"
+    "  SELECT user_telegram_id, 'FEE', %s, %s, %s, id FROM tx RETURNING id"
+    ") "
+    "SELECT (SELECT id FROM tx), (SELECT balance FROM credit)"
+)
+
+# Cache do lucro total (soma de todas as taxas). É marcado como "sujo" a cada escrita em
+# transações; bot e webhooks rodam no mesmo processo (um único worker do gunicorn), então isso
+# inclui as taxas de depósito gravadas por confirm_deposit(). O PROFIT_CACHE_TTL só cobre
+# escritas feitas fora do app (ex.: correções manuais direto no banco).
+PROFIT_CACHE_TTL = 60
+_profit_cache = {"value": None, "version": 0, "cached_version": -1, "expires_at": 0.0}
+_profit_cache_lock = threading.Lock()
+
+def _invalidate_profit_cache():
+    """Força o próximo calculate_profits() a consultar o banco novamente."""
+    with _profit_cache_lock:
+        _profit_cache["version"] += 1
+
+# Cache do saldo e das informações de cada usuário: absorve as rajadas de /start, /carteira
+# e cliques no menu. Bot e webhook rodam no mesmo processo, e toda escrita de saldo atualiza ou
+# descarta a entrada do usuário (ver invalidate_balance_cache); o TTL é só uma rede de segurança
+# para alterações feitas direto no banco.
+USER_CACHE_TTL = config.BALANCE_CACHE_TTL
+_USER_CACHE_MAX = 16384
+_balance_cache = {}    # telegram_id -> (expira_em, saldo)
+_user_info_cache = {}  # telegram_id -> (expira_em, linha de get_user_info)
+_user_cache_generation = 0
+_user_cache_lock = threading.Lock()
+_MISSING = object()
+
+def _user_cache_get(cache, telegram_id):
+    """Retorna (valor, geração); o valor é _MISSING se não houver entrada válida."""
+    with _user_cache_lock:
+        entry = cache.get(telegram_id)
+        if entry is not None and entry[0] > time.monotonic():
+            return entry[1], _user_cache_generation
+        return _MISSING, _user_cache_generation
+
+def _user_cache_put(cache, telegram_id, value, generation):
+    """Guarda um valor lido do banco, a menos que alguma escrita tenha ocorrido desde a leitura."""
+    with _user_cache_lock:
+        if generation != _user_cache_generation:
+            return
+        if len(cache) >= _USER_CACHE_MAX:
+            now = time.monotonic()
+            for expired_id in [uid for uid, entry in cache.items() if entry[0] <= now]:
+                del cache[expired_id]
+            if len(cache) >= _USER_CACHE_MAX:
+                cache.clear()
+        cache[telegram_id] = (time.monotonic() + USER_CACHE_TTL, value)
+
+def _user_cache_set_balance(telegram_id, balance):
+    """Registra um saldo já confirmado no banco (após o commit) e descarta o info em cache."""
+    global _user_cache_generation
+    with _user_cache_lock:
+        _user_cache_generation += 1
+        _balance_cache[telegram_id] = (time.monotonic() + USER_CACHE_TTL, balance)
+        _user_info_cache.pop(telegram_id, None)
+
+def invalidate_balance_cache(telegram_id):
     """
-    Cria e retorna uma nova conexão com o banco de dados PostgreSQL.
-    Configura o DictCursor para permitir acesso às colunas por nome.
+    Descarta o saldo e o info em cache de um usuário. Quem altera o saldo com `conn_ext`
+    deve chamá-la de novo após o commit, para não sobrar em cache um valor lido antes dele.
     """
-    try:
-        conn = psycopg2.connect(config.DATABASE_URL)
-        return conn
-    except psycopg2.OperationalError as e:
-        logger.critical(f"FATAL: Não foi possível conectar ao banco de dados PostgreSQL: {e}", exc_info=True)
-        raise
+    global _user_cache_generation
+    with _user_cache_lock:
+        _user_cache_generation += 1
+        _balance_cache.pop(telegram_id, None)
+        _user_info_cache.pop(telegram_id, None)
+
+# Parâmetros de sessão aplicados no handshake de cada conexão (sem round trip extra).
+# Equivalem ao busy_timeout do SQLite: uma espera por lock ou uma consulta travada falha
+# rápido com erro em vez de prender a thread do handler indefinidamente.
+DB_CONNECT_TIMEOUT = 10
+_DB_SESSION_OPTIONS = "-c lock_timeout=30000 -c statement_timeout=60000 -c idle_in_transaction_session_timeout=60000"
+
+# Pool de conexões do processo: evita um handshake TCP/TLS/autenticação a cada consulta.
+# O pool só é criado no primeiro uso, para importar o módulo não exigir o banco no ar.
+DB_POOL_MIN = 2
+DB_POOL_MAX = 10
+_pool = None
+_pool_lock = threading.Lock()
+# O ThreadedConnectionPool lança PoolError quando esgotado; o semáforo faz a thread esperar a vez.
+_pool_slots = threading.BoundedSemaphore(DB_POOL_MAX)
+
+class _PooledConnection(psycopg2.extensions.connection):
+    """Conexão do pool; `prepared` indica se as consultas de _PREPARED_STATEMENTS já foram preparadas nela."""
+    prepared = False
+
+def _get_pool():
+    """Retorna o pool de conexões, criando-o na primeira chamada."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                try:
+                    _pool = ThreadedConnectionPool(
+                        DB_POOL_MIN, DB_POOL_MAX, config.DATABASE_URL,
+                        connect_timeout=DB_CONNECT_TIMEOUT, options=_DB_SESSION_OPTIONS,
+                        connection_factory=_PooledConnection
+                    )
+                except psycopg2.OperationalError as e:
+                    logger.critical("FATAL: Não foi possível criar o pool de conexões PostgreSQL: %s", e, exc_info=True)
+                    raise
+    return _pool
+
+@contextmanager
+def db():
+    """
+    Empresta uma conexão do pool pelo tempo do bloco `with`.
+    Ao sair faz commit (ou rollback, se houver exceção) e devolve a conexão ao pool.
+    """
+    _ensure_schema()
+    with _connection() as conn:
+        if not conn.prepared:
+            _prepare_statements(conn)
+        yield conn
+
+@contextmanager
+def _read_only():
+    """
+    Conexão do pool em autocommit, para as leituras de uma única consulta: sem transação aberta,
+    o psycopg2 não envia BEGIN antes nem COMMIT depois, economizando dois round trips por leitura.
+    Escritas continuam usando db()/_txn(), com transação explícita.
+    """
+    # Sem o `with conn` de _connection(): no psycopg2 2.9 ele abre transação mesmo em autocommit,
+    # e aí o autocommit não pode mais ser desligado ao devolver a conexão.
+    _ensure_schema()
+    with _pool_slots:
+        pool = _get_pool()
+        conn = pool.getconn()
+        try:
+            if not conn.prepared:
+                _prepare_statements(conn)
+            conn.autocommit = True
+            try:
+                yield conn
+            finally:
+                if not conn.closed:
+                    conn.autocommit = False
+        finally:
+            # Conexões derrubadas pelo servidor são descartadas em vez de voltarem ao pool
+            pool.putconn(conn, close=bool(conn.closed))
+
+def _prepare_statements(conn):
+    """Prepara as consultas quentes na sessão da conexão (uma vez por conexão física)."""
+    with conn.cursor() as cursor:
+        for statement in _PREPARED_STATEMENTS:
+            cursor.execute(statement)
+    # Commit logo em seguida para um rollback do chamador não descartar o trabalho feito aqui
+    conn.commit()
+    conn.prepared = True
+
+@contextmanager
+def _connection():
+    """Como db(), mas sem garantir o schema (usado pelo próprio init_db)."""
+    with _pool_slots:
+        pool = _get_pool()
+        conn = pool.getconn()
+        try:
+            with conn:
+                yield conn
+        finally:
+            # Conexões derrubadas pelo servidor são descartadas em vez de voltarem ao pool
+            pool.putconn(conn, close=bool(conn.closed))
+
+_schema_ready = False
+_SCHEMA_LOCK_ID = 7281001  # Chave do advisory lock do init_db
+_schema_lock = threading.Lock()
+
+def _ensure_schema():
+    """Roda o init_db uma única vez por processo, no primeiro acesso ao banco (e não na importação)."""
+    global _schema_ready
+    if _schema_ready:
+        return
+    # Só uma thread roda o DDL; as demais esperam aqui em vez de executá-lo ao mesmo tempo
+    with _schema_lock:
+        if not _schema_ready:
+            init_db()
+            _schema_ready = True
 
 def init_db():
     """
     Inicializa o banco de dados, criando as tabelas se não existirem.
+    Todo o DDL roda em uma única transação.
     """
-    with get_db_connection() as conn:
+    with _connection() as conn:
         with conn.cursor() as cursor:
+            # Serializa o DDL entre processos (ex.: deploy com a instância anterior ainda no ar);
+            # o lock é liberado no fim da transação
+            cursor.execute("SELECT pg_advisory_xact_lock(%s)", (_SCHEMA_LOCK_ID,))
             # Tabela de Usuários
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS users (
                     telegram_id BIGINT PRIMARY KEY,
                     username TEXT,
                     first_name TEXT,
-                    balance REAL DEFAULT 0.00,
-                    created_at TIMESTAMPTZ NOT NULL
+                    balance NUMERIC(12,2) DEFAULT 0.00,
+                    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
                 )
             ''')
             # Tabela de Transações
@@ -47,227 +324,464 @@ def init_db():
                     id SERIAL PRIMARY KEY,
                     user_telegram_id BIGINT NOT NULL,
                     type TEXT NOT NULL,
-                    amount REAL NOT NULL,
+                    amount NUMERIC(12,2) NOT NULL,
                     status TEXT NOT NULL,
                     pix_key TEXT,
                     mercado_pago_id TEXT,
                     admin_notes TEXT,
-                    created_at TIMESTAMPTZ NOT NULL,
-                    updated_at TIMESTAMPTZ NOT NULL,
+                    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+                    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
                     FOREIGN KEY (user_telegram_id) REFERENCES users (telegram_id)
                 )
             ''')
-        conn.commit()
+            # Migração das colunas monetárias criadas como REAL (float) em versões anteriores
+            cursor.execute(
+                "SELECT table_name, column_name FROM information_schema.columns "
+                "WHERE table_schema = current_schema() AND data_type = 'real' "
+                "AND (table_name, column_name) IN (('users', 'balance'), ('transactions', 'amount'))"
+            )
+            for table_name, column_name in cursor.fetchall():
+                cursor.execute(
+                    f"ALTER TABLE {table_name} ALTER COLUMN {column_name} TYPE NUMERIC(12,2) "
+                    f"USING round({column_name}::NUMERIC, 2)"
+                )
+                logger.info("🔧 Coluna %s.%s migrada de REAL para NUMERIC(12,2).", table_name, column_name)
+            # Os timestamps são preenchidos pelo banco (tabelas criadas antes não tinham DEFAULT).
+            # Os ALTER TABLE travam a tabela inteira, então só rodam quando ainda falta o DEFAULT.
+            cursor.execute(
+                "SELECT table_name, column_name FROM information_schema.columns "
+                "WHERE table_schema = current_schema() AND column_default IS NULL "
+                "AND (table_name, column_name) IN (('users', 'created_at'), ('transactions', 'created_at'), ('transactions', 'updated_at'))"
+            )
+            for table_name, column_name in cursor.fetchall():
+                cursor.execute(f"ALTER TABLE {table_name} ALTER COLUMN {column_name} SET DEFAULT NOW()")
+            # Vínculo da taxa (FEE) com a transação que a gerou (saque ou depósito)
+            cursor.execute(
+                "SELECT 1 FROM information_schema.columns WHERE table_schema = current_schema() "
+                "AND table_name = 'transactions' AND column_name = 'related_transaction_id'"
+            )
+            if cursor.fetchone() is None:
+                cursor.execute("ALTER TABLE transactions ADD COLUMN related_transaction_id INTEGER REFERENCES transactions (id)")
+                # Migração das taxas antigas, que só guardavam o vínculo no texto do admin_notes ("... ID <n>")
+                cursor.execute(
+                    "UPDATE transactions SET related_transaction_id = substring(admin_notes FROM 'ID ([0-9]+)$')::INTEGER "
+                    "WHERE type = 'FEE' AND related_transaction_id IS NULL AND admin_notes ~ 'ID [0-9]+$'"
+                )
+                logger.info("🔧 Coluna transactions.related_transaction_id criada e preenchida.")
+            # Índices das consultas mais frequentes: lucro/saques pendentes (type + status),
+            # última transação do usuário (user + updated_at), taxa de um saque (related_transaction_id)
+            # e depósito pendente do webhook do MP, respondido só pelo índice (INCLUDE das colunas lidas)
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_tx_type_status ON transactions (type, status)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_tx_user_updated ON transactions (user_telegram_id, updated_at DESC)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_tx_related ON transactions (related_transaction_id)")
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS idx_tx_mpid_status ON transactions (mercado_pago_id, status) "
+                "INCLUDE (id, user_telegram_id, amount)"
+            )
     logger.info("✅ Banco de dados PostgreSQL inicializado e verificado com sucesso.")
 
 def admin_set_balance(user_telegram_id, new_balance):
     """[ADMIN] Define um novo saldo para um usuário."""
-    with get_db_connection() as conn:
-        try:
+    return admin_set_balances_bulk([(user_telegram_id, new_balance)]) == 1
+
+def admin_set_balances_bulk(pairs):
+    """
+    [ADMIN] Define o saldo de vários usuários de uma vez, a partir de pares (telegram_id, novo_saldo).
+    Os UPDATEs e os registros de AJUSTE_MANUAL vão em uma única transação e em dois round trips,
+    independentemente da quantidade de usuários. Retorna quantos usuários foram atualizados.
+    """
+    if not pairs:
+        return 0
+    try:
+        with db() as conn:
             with conn.cursor() as cursor:
-                cursor.execute(
-                    "UPDATE users SET balance = %s WHERE telegram_id = %s",
-                    (new_balance, user_telegram_id)
+                # Só usuários existentes voltam no RETURNING, e só eles recebem o registro do ajuste
+                updated = execute_values(
+                    cursor,
+                    "UPDATE users SET balance = v.balance FROM (VALUES %s) AS v (telegram_id, balance) "
+                    "WHERE users.telegram_id = v.telegram_id RETURNING users.telegram_id, users.balance",
+                    pairs, template="(%s::BIGINT, %s::NUMERIC(12,2))", fetch=True
                 )
-                if cursor.rowcount > 0:
-                    record_transaction(
-                        user_telegram_id=user_telegram_id, type='AJUSTE_MANUAL',
-                        amount=new_balance, status='CONCLUIDO',
-                        admin_notes=f"Saldo definido para R${new_balance:.2f} por um admin."
+                if updated:
+                    execute_values(
+                        cursor,
+                        "INSERT INTO transactions (user_telegram_id, type, amount, status, admin_notes) VALUES %s",
+                        [
+                            (telegram_id, 'AJUSTE_MANUAL', balance, 'CONCLUIDO',
+                             f"Saldo definido para R${balance:.2f} por um admin.")
+                            for telegram_id, balance in updated
+                        ]
                     )
-                    conn.commit()
-                    return True
-                return False
-        except psycopg2.Error as e:
-            logger.error(f"❌ Erro no DB ao setar saldo para {user_telegram_id}: {e}", exc_info=True)
-            conn.rollback()
-            return False
+        for telegram_id, balance in updated:
+            _user_cache_set_balance(telegram_id, balance)
+        _invalidate_profit_cache()
+        logger.info("👑 Saldo definido por um admin para %s de %s usuário(s).", len(updated), len(pairs))
+        return len(updated)
+    except psycopg2.Error as e:
+        logger.error("❌ Erro no DB ao setar saldo em lote para %s usuário(s): %s", len(pairs), e, exc_info=True)
+        return 0
 
-def get_users_with_balance():
-    """[ADMIN] Retorna todos os usuários com saldo maior que zero."""
-    with get_db_connection() as conn:
-        with conn.cursor(cursor_factory=DictCursor) as cursor:
+def get_users_with_balance(limit=25, offset=0):
+    """
+    [ADMIN] Retorna uma página dos usuários com saldo maior que zero, do maior para o menor saldo.
+    Cada linha é uma tupla (telegram_id, first_name, username, balance).
+    """
+    with _read_only() as conn:
+        with conn.cursor() as cursor:
             try:
-                cursor.execute("SELECT telegram_id, first_name, username, balance FROM users WHERE balance > 0 ORDER BY balance DESC")
+                cursor.execute(
+                    "SELECT telegram_id, first_name, username, balance FROM users WHERE balance > 0 "
+                    "ORDER BY balance DESC, telegram_id LIMIT %s OFFSET %s",
+                    (limit, offset)
+                )
                 return cursor.fetchall()
             except psycopg2.Error as e:
-                logger.error(f"❌ Erro ao buscar usuários com saldo: {e}", exc_info=True)
+                logger.error("❌ Erro ao buscar usuários com saldo: %s", e, exc_info=True)
                 return []
 
 def create_user_if_not_exists(telegram_id, username, first_name):
     """Cria um novo usuário se ele não existir."""
-    now = datetime.now()
-    with get_db_connection() as conn:
+    with db() as conn:
         try:
             with conn.cursor() as cursor:
                 sql = """
-                    INSERT INTO users (telegram_id, username, first_name, balance, created_at)
-                    VALUES (%s, %s, %s, 0.00, %s)
+                    INSERT INTO users (telegram_id, username, first_name, balance)
+                    VALUES (%s, %s, %s, 0.00)
                     ON CONFLICT (telegram_id) DO NOTHING;
                 """
-                cursor.execute(sql, (telegram_id, username, first_name, now))
+                cursor.execute(sql, (telegram_id, username, first_name))
                 if cursor.rowcount > 0:
-                    logger.info(f"👤 Novo usuário criado: ID={telegram_id}, Nome='{first_name}'.")
+                    logger.info("👤 Novo usuário criado: ID=%s, Nome='%s'.", telegram_id, first_name)
             conn.commit()
         except psycopg2.Error as e:
-            logger.error(f"❌ Erro ao tentar criar usuário {telegram_id}: {e}", exc_info=True)
+            logger.error("❌ Erro ao tentar criar usuário %s: %s", telegram_id, e, exc_info=True)
             conn.rollback()
 
+def upsert_and_get_balance(telegram_id, username, first_name):
+    """
+    Cria o usuário se ele não existir (ou atualiza nome/username) e retorna o saldo,
+    tudo em um único round trip. Usado no /start no lugar de create_user_if_not_exists + get_balance.
+    """
+    try:
+        with db() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(_SQL_UPSERT_USER_RETURNING_BALANCE, (telegram_id, username, first_name))
+                balance, inserted = cursor.fetchone()
+        _user_cache_set_balance(telegram_id, balance)
+        if inserted:
+            logger.info("👤 Novo usuário criado: ID=%s, Nome='%s'.", telegram_id, first_name)
+        return balance
+    except psycopg2.Error as e:
+        logger.error("❌ Erro ao criar/buscar saldo do usuário %s: %s", telegram_id, e, exc_info=True)
+        return ZERO
+
+def get_wallet_snapshot(telegram_id, username, first_name):
+    """
+    Cria o usuário se ele não existir e retorna (saldo, data da última movimentação) com uma única
+    consulta. Usado no /carteira no lugar de create_user_if_not_exists + get_balance + a busca da última transação.
+    """
+    try:
+        with db() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(_SQL_WALLET_SNAPSHOT, (telegram_id, username, first_name, telegram_id, telegram_id))
+                row = cursor.fetchone()
+                if row is None:
+                    # Outro processo criou o usuário entre o início da instrução e o INSERT (o conflito
+                    # o esconde do INSERT e o snapshot, do SELECT): uma nova instrução já o enxerga.
+                    cursor.execute(_SQL_WALLET_SNAPSHOT, (telegram_id, username, first_name, telegram_id, telegram_id))
+                    row = cursor.fetchone()
+                balance, inserted, last_updated_at = row
+        _user_cache_set_balance(telegram_id, balance)
+        if inserted:
+            logger.info("👤 Novo usuário criado: ID=%s, Nome='%s'.", telegram_id, first_name)
+        last_update = last_updated_at.strftime('%d/%m/%Y %H:%M') if last_updated_at else "Nenhuma transação"
+        return balance, last_update
+    except psycopg2.Error as e:
+        logger.error("❌ Erro ao consultar a carteira do usuário %s: %s", telegram_id, e, exc_info=True)
+        return ZERO, "Erro ao consultar"
+
 def get_balance(telegram_id):
-    """Busca e retorna o saldo de um usuário."""
-    with get_db_connection() as conn:
+    """Busca e retorna o saldo de um usuário (com cache de USER_CACHE_TTL segundos)."""
+    balance, generation = _user_cache_get(_balance_cache, telegram_id)
+    if balance is not _MISSING:
+        return balance
+    with _read_only() as conn:
         with conn.cursor(cursor_factory=DictCursor) as cursor:
             try:
-                cursor.execute("SELECT balance FROM users WHERE telegram_id = %s", (telegram_id,))
+                cursor.execute(_SQL_GET_BALANCE, (telegram_id,))
                 result = cursor.fetchone()
-                return result['balance'] if result else 0.00
+                balance = result['balance'] if result else ZERO
+                _user_cache_put(_balance_cache, telegram_id, balance, generation)
+                return balance
             except psycopg2.Error as e:
-                logger.error(f"❌ Erro ao buscar saldo para {telegram_id}: {e}", exc_info=True)
-                return 0.00
+                logger.error("❌ Erro ao buscar saldo para %s: %s", telegram_id, e, exc_info=True)
+                return ZERO
+
+@contextmanager
+def _txn(conn_ext=None):
+    """
+    Conexão para uma função de escrita. Com `conn_ext`, a operação entra na transação do chamador,
+    que decide commit, rollback e fechamento. Sem ele, usa uma conexão do pool com commit ao final
+    (ou rollback, se houver exceção).
+    """
+    if conn_ext is not None:
+        yield conn_ext
+    else:
+        with db() as conn:
+            yield conn
 
 def update_balance(telegram_id, amount_change, conn_ext=None):
     """Atualiza o saldo de um usuário."""
-    conn = conn_ext or get_db_connection()
+    amount_change = to_money(amount_change)
     try:
-        with conn.cursor(cursor_factory=DictCursor) as cursor:
-            cursor.execute("SELECT balance FROM users WHERE telegram_id = %s FOR UPDATE", (telegram_id,))
-            result = cursor.fetchone()
-            current_balance = result['balance'] if result else 0.0
-            new_balance = current_balance + amount_change
-            if new_balance < 0:
-                logger.warning(f"⚠️ Tentativa de deixar saldo negativo para {telegram_id}.")
-                return False
-            cursor.execute("UPDATE users SET balance = %s WHERE telegram_id = %s", (new_balance, telegram_id))
-            if not conn_ext: conn.commit()
-            logger.info(f"💰 Saldo de {telegram_id} atualizado. De R${current_balance:.2f} para R${new_balance:.2f} (Mudança: {amount_change:+.2f}).")
-            return True
+        with _txn(conn_ext) as conn:
+            with conn.cursor() as cursor:
+                # Uma única instrução: o banco soma e valida o saldo na própria linha, sem ler o valor antes.
+                cursor.execute(_SQL_UPDATE_BALANCE, (amount_change, telegram_id, amount_change))
+                result = cursor.fetchone()
+        if result is None:
+            logger.warning("⚠️ Saldo de %s não alterado: usuário inexistente ou saldo ficaria negativo.", telegram_id)
+            return False
+        new_balance = result[0]
+        if conn_ext is None:
+            _user_cache_set_balance(telegram_id, new_balance)
+        else:
+            # A transação é do chamador e ainda pode ser desfeita: só descarta o que está em cache
+            invalidate_balance_cache(telegram_id)
+        logger.info("💰 Saldo de %s atualizado. De R$%.2f para R$%.2f (Mudança: %+.2f).", telegram_id, new_balance - amount_change, new_balance, amount_change)
+        return True
     except psycopg2.Error as e:
-        logger.error(f"❌ Erro ao atualizar saldo para {telegram_id}: {e}", exc_info=True)
-        if conn_ext is None and conn: conn.rollback()
+        logger.error("❌ Erro ao atualizar saldo para %s: %s", telegram_id, e, exc_info=True)
         return False
-    finally:
-        if conn_ext is None and conn: conn.close()
 
-def record_transaction(**kwargs):
+def record_transaction(user_telegram_id, type, amount, status, pix_key=None, mercado_pago_id=None,
+                       admin_notes=None, related_transaction_id=None, conn_ext=None):
     """Registra uma nova transação no banco de dados."""
-    conn = kwargs.pop('conn_ext', None) or get_db_connection()
-    now = datetime.now()
-    kwargs.setdefault('pix_key', None); kwargs.setdefault('mercado_pago_id', None); kwargs.setdefault('admin_notes', None)
-    kwargs['created_at'] = now; kwargs['updated_at'] = now
+    params = (user_telegram_id, type, amount, status, pix_key, mercado_pago_id, admin_notes, related_transaction_id)
     try:
-        with conn.cursor(cursor_factory=DictCursor) as cursor:
-            columns = ', '.join(kwargs.keys())
-            placeholders = ', '.join(['%s'] * len(kwargs))
-            sql = f"INSERT INTO transactions ({columns}) VALUES ({placeholders}) RETURNING id"
-            cursor.execute(sql, tuple(kwargs.values()))
-            transaction_id = cursor.fetchone()['id']
-            if 'conn_ext' not in kwargs: conn.commit()
-            logger.info(f"📄 Transação {transaction_id} (Tipo: {kwargs['type']}) registrada para usuário {kwargs['user_telegram_id']}.")
-            return transaction_id
+        with _txn(conn_ext) as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(_SQL_INSERT_TRANSACTION, params)
+                transaction_id = cursor.fetchone()[0]
+        _invalidate_profit_cache()
+        logger.info("📄 Transação %s (Tipo: %s) registrada para usuário %s.", transaction_id, type, user_telegram_id)
+        return transaction_id
+    except psycopg2.Error as e:
+        logger.error("❌ Erro ao registrar transação para %s: %s", user_telegram_id, e, exc_info=True)
+        return None
+
+def record_transactions_batch(rows, conn_ext=None):
+    """
+    Registra várias transações com um único INSERT de múltiplas linhas (em páginas de 200).
+    Cada item de `rows` é um dict com as mesmas chaves aceitas por record_transaction.
+    Retorna a lista de IDs na mesma ordem de `rows`, ou None se nada foi gravado.
+    """
+    if not rows:
+        return []
+    values = [tuple(row.get(column) for column in _TRANSACTION_COLUMNS) for row in rows]
+    try:
+        with _txn(conn_ext) as conn:
+            with conn.cursor() as cursor:
+                inserted = execute_values(
+                    cursor,
+                    _SQL_INSERT_TRANSACTIONS_BATCH,
+                    values, page_size=200, fetch=True
+                )
+        _invalidate_profit_cache()
+        logger.info("📄 %s transações registradas em lote.", len(inserted))
+        return [row[0] for row in inserted]
     except psycopg2.Error as e:
-        logger.error(f"❌ Erro ao registrar transação para {kwargs.get('user_telegram_id')}: {e}", exc_info=True)
-        if 'conn_ext' not in kwargs and conn: conn.rollback()
+        logger.error("❌ Erro ao registrar lote de %s transações: %s", len(rows), e, exc_info=True)
+        return None
+
+def record_withdrawal(user_telegram_id, amount, fee, pix_key, conn_ext=None):
+    """
+    Registra um saque (em análise) e a taxa correspondente com um único INSERT.
+    Retorna o ID do saque, ou None em caso de erro.
+    """
+    params = (user_telegram_id, to_money(amount), config.STATUS_EM_ANALISE, pix_key, to_money(fee), config.STATUS_CONCLUIDO)
+    try:
+        with _txn(conn_ext) as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(_SQL_INSERT_WITHDRAWAL_WITH_FEE, params)
+                transaction_id = cursor.fetchone()[0]
+        _invalidate_profit_cache()
+        logger.info("📄 Saque %s e taxa registrados para usuário %s.", transaction_id, user_telegram_id)
+        return transaction_id
+    except psycopg2.Error as e:
+        logger.error("❌ Erro ao registrar saque para %s: %s", user_telegram_id, e, exc_info=True)
         return None
-    finally:
-        if 'conn_ext' not in kwargs and conn: conn.close()
 
 def update_transaction_status(transaction_id, new_status, **kwargs):
     """Atualiza o status e outros campos de uma transação."""
-    conn = kwargs.pop('conn_ext', None) or get_db_connection()
-    fields_to_update = ["status = %s", "updated_at = %s"]
-    values = [new_status, datetime.now()]
-    if 'mp_id' in kwargs:
-        fields_to_update.append("mercado_pago_id = %s")
-        values.append(kwargs['mp_id'])
-    if 'admin_notes' in kwargs:
-        fields_to_update.append("admin_notes = %s")
-        values.append(kwargs['admin_notes'])
-    values.append(transaction_id)
+    values = (new_status, kwargs.get('mp_id'), kwargs.get('admin_notes'), transaction_id)
     try:
-        with conn.cursor() as cursor:
-            sql = f"UPDATE transactions SET {', '.join(fields_to_update)} WHERE id = %s"
-            cursor.execute(sql, tuple(values))
-            if 'conn_ext' not in kwargs: conn.commit()
-        logger.info(f"🔄 Status da transação {transaction_id} atualizado para '{new_status}'.")
+        with _txn(kwargs.get('conn_ext')) as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(_SQL_UPDATE_TRANSACTION_STATUS, values)
+        _invalidate_profit_cache()
+        logger.info("🔄 Status da transação %s atualizado para '%s'.", transaction_id, new_status)
+        return True
+    except psycopg2.Error as e:
+        logger.error("❌ Erro ao atualizar status da transação %s: %s", transaction_id, e, exc_info=True)
+        return False
+
+def try_claim_transaction(transaction_id, from_status, to_status):
+    """
+    Muda o status de uma transação apenas se ela ainda estiver em `from_status` (compare-and-set).
+    Retorna True somente para quem efetivamente fez a transição, evitando processamento duplicado.
+    """
+    try:
+        with db() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(_SQL_CLAIM_TRANSACTION, (to_status, transaction_id, from_status))
+                claimed = cursor.rowcount == 1
+        if claimed:
+            _invalidate_profit_cache()
+            logger.info("🔒 Transação %s assumida: '%s' -> '%s'.", transaction_id, from_status, to_status)
+        return claimed
+    except psycopg2.Error as e:
+        logger.error("❌ Erro ao assumir a transação %s: %s", transaction_id, e, exc_info=True)
+        return False
+
+def reject_withdrawal(transaction_id, user_telegram_id, refund_amount, admin_notes,
+                      new_status=config.STATUS_RECUSADO, expected_status=config.STATUS_EM_ANALISE):
+    """
+    Encerra um saque (recusado ou com falha no pagamento) e estorna o valor ao usuário
+    em uma única transação: ou as duas alterações são gravadas, ou nenhuma.
+    Só age se o saque ainda estiver em `expected_status`, impedindo estornos em dobro.
+    """
+    try:
+        with db() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    "UPDATE transactions SET status = %s, admin_notes = %s, updated_at = NOW() WHERE id = %s AND status = %s",
+                    (new_status, admin_notes, transaction_id, expected_status)
+                )
+                if cursor.rowcount != 1:
+                    logger.warning("⚠️ Saque %s não está mais em '%s'. Nada foi alterado.", transaction_id, expected_status)
+                    conn.rollback()
+                    return False
+                cursor.execute("UPDATE users SET balance = balance + %s WHERE telegram_id = %s", (refund_amount, user_telegram_id))
+                if cursor.rowcount != 1:
+                    logger.error("❌ Usuário %s não encontrado ao estornar o saque %s.", user_telegram_id, transaction_id)
+                    conn.rollback()
+                    return False
+        invalidate_balance_cache(user_telegram_id)
+        _invalidate_profit_cache()
+        logger.info("↩️ Saque %s marcado como '%s' e R$%.2f estornados para %s.", transaction_id, new_status, refund_amount, user_telegram_id)
+        return True
+    except psycopg2.Error as e:
+        logger.error("❌ Erro ao encerrar e estornar o saque %s: %s", transaction_id, e, exc_info=True)
+        return False
+
+def confirm_deposit(transaction_id, user_telegram_id, net_amount, fee_amount):
+    """
+    Aprova um depósito pendente: status pago, crédito do valor líquido e registro da taxa,
+    tudo em uma única instrução (e transação). Retorna True somente se o depósito foi creditado agora.
+    """
+    params = (
+        config.STATUS_DEPOSITO_PAGO, transaction_id, config.STATUS_DEPOSITO_PENDENTE,
+        to_money(net_amount),
+        to_money(fee_amount), config.STATUS_CONCLUIDO, f"Taxa de depósito referente à transação ID {transaction_id}",
+    )
+    try:
+        with db() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(_SQL_CONFIRM_DEPOSIT, params)
+                confirmed_id, new_balance = cursor.fetchone()
+            if confirmed_id is None:
+                logger.warning("⚠️ Depósito %s não está mais pendente. Nada foi alterado.", transaction_id)
+                return False
+            if new_balance is None:
+                logger.error("❌ Usuário %s não encontrado ao creditar o depósito %s.", user_telegram_id, transaction_id)
+                conn.rollback()
+                return False
+        _user_cache_set_balance(user_telegram_id, new_balance)
+        _invalidate_profit_cache()
+        logger.info("📥 Depósito %s confirmado: R$%.2f creditados para %s.", transaction_id, to_money(net_amount), user_telegram_id)
         return True
     except psycopg2.Error as e:
-        logger.error(f"❌ Erro ao atualizar status da transação {transaction_id}: {e}", exc_info=True)
-        if 'conn_ext' not in kwargs and conn: conn.rollback()
+        logger.error("❌ Erro ao confirmar o depósito %s: %s", transaction_id, e, exc_info=True)
         return False
-    finally:
-        if 'conn_ext' not in kwargs and conn: conn.close()
 
 def get_transaction_details(transaction_id):
     """Busca todos os detalhes de uma transação pelo seu ID."""
-    with get_db_connection() as conn:
+    with _read_only() as conn:
         with conn.cursor(cursor_factory=DictCursor) as cursor:
             try:
-                cursor.execute("SELECT * FROM transactions WHERE id = %s", (transaction_id,))
+                cursor.execute(_SQL_GET_TRANSACTION, (transaction_id,))
                 return cursor.fetchone()
             except psycopg2.Error as e:
-                logger.error(f"❌ Erro ao buscar detalhes da transação {transaction_id}: {e}", exc_info=True)
+                logger.error("❌ Erro ao buscar detalhes da transação %s: %s", transaction_id, e, exc_info=True)
                 return None
 
 # Funções restantes (get_pending_withdrawals, calculate_profits, etc.) com placeholders %s
-def get_pending_withdrawals():
-    """Retorna todas as transações de saque com status 'EM ANÁLISE'."""
-    with get_db_connection() as conn:
+def get_pending_withdrawals(limit=None, after_id=0):
+    """
+    Retorna os saques com status 'EM ANÁLISE' (do mais antigo ao mais novo), já com o nome do usuário.
+    Pagina com `limit` e `after_id` (o último ID da página anterior); cada linha traz em `remaining`
+    quantos pendentes existem a partir da página atual.
+    """
+    with _read_only() as conn:
         with conn.cursor(cursor_factory=DictCursor) as cursor:
             try:
-                cursor.execute("SELECT * FROM transactions WHERE type = 'WITHDRAWAL' AND status = %s", (config.STATUS_EM_ANALISE,))
+                cursor.execute(_SQL_GET_PENDING_WITHDRAWALS, (config.STATUS_EM_ANALISE, after_id, limit))
                 return cursor.fetchall()
             except psycopg2.Error as e:
-                logger.error(f"❌ Erro ao buscar saques pendentes: {e}", exc_info=True)
+                logger.error("❌ Erro ao buscar saques pendentes: %s", e, exc_info=True)
                 return []
 
 def calculate_profits():
-    """Calcula o lucro total somando todas as transações do tipo 'FEE'."""
-    with get_db_connection() as conn:
+    """
+    Calcula o lucro total somando todas as transações do tipo 'FEE'.
+    O resultado fica em cache até a próxima escrita em transações ou até expirar.
+    """
+    with _profit_cache_lock:
+        version = _profit_cache["version"]
+        if _profit_cache["cached_version"] == version and time.monotonic() < _profit_cache["expires_at"]:
+            return _profit_cache["value"]
+
+    with _read_only() as conn:
         with conn.cursor(cursor_factory=DictCursor) as cursor:
             try:
                 cursor.execute("SELECT SUM(amount) FROM transactions WHERE type = 'FEE' AND status = %s", (config.STATUS_CONCLUIDO,))
                 result = cursor.fetchone()
-                return result[0] if result and result[0] is not None else 0.00
+                total = result[0] if result and result[0] is not None else ZERO
+                with _profit_cache_lock:
+                    # Só guarda se nenhuma escrita aconteceu durante a consulta
+                    if _profit_cache["version"] == version:
+                        _profit_cache.update(value=total, cached_version=version, expires_at=time.monotonic() + PROFIT_CACHE_TTL)
+                return total
             except psycopg2.Error as e:
-                logger.error(f"❌ Erro ao calcular lucro: {e}", exc_info=True)
-                return 0.00
+                logger.error("❌ Erro ao calcular lucro: %s", e, exc_info=True)
+                return ZERO
 
 def get_fee_for_withdrawal(withdrawal_transaction_id):
     """Busca o valor da taxa associada a uma transação de saque."""
-    with get_db_connection() as conn:
+    with _read_only() as conn:
         with conn.cursor(cursor_factory=DictCursor) as cursor:
             try:
-                note = f"Taxa referente ao saque ID {withdrawal_transaction_id}"
-                cursor.execute("SELECT amount FROM transactions WHERE type = 'FEE' AND admin_notes = %s", (note,))
+                cursor.execute("SELECT amount FROM transactions WHERE type = 'FEE' AND related_transaction_id = %s", (withdrawal_transaction_id,))
                 result = cursor.fetchone()
-                return result['amount'] if result else 0.00
+                return result['amount'] if result else ZERO
             except psycopg2.Error as e:
-                logger.error(f"❌ Erro ao buscar taxa para o saque {withdrawal_transaction_id}: {e}", exc_info=True)
-                return 0.00
+                logger.error("❌ Erro ao buscar taxa para o saque %s: %s", withdrawal_transaction_id, e, exc_info=True)
+                return ZERO
 
 def get_user_info(telegram_id):
-    """Busca informações básicas de um usuário."""
-    with get_db_connection() as conn:
+    """Busca informações básicas de um usuário (com cache de USER_CACHE_TTL segundos)."""
+    user_info, generation = _user_cache_get(_user_info_cache, telegram_id)
+    if user_info is not _MISSING:
+        return user_info
+    with _read_only() as conn:
         with conn.cursor(cursor_factory=DictCursor) as cursor:
             try:
-                cursor.execute("SELECT * FROM users WHERE telegram_id = %s", (telegram_id,))
-                return cursor.fetchone()
+                cursor.execute(_SQL_GET_USER_INFO, (telegram_id,))
+                user_info = cursor.fetchone()
+                if user_info is not None:
+                    _user_cache_put(_user_info_cache, telegram_id, user_info, generation)
+                return user_info
             except psycopg2.Error as e:
-                logger.error(f"❌ Erro ao buscar info do usuário {telegram_id}: {e}", exc_info=True)
+                logger.error("❌ Erro ao buscar info do usuário %s: %s", telegram_id, e, exc_info=True)
                 return None
-
-def get_last_transaction_date(telegram_id):
-    """Busca a data da última transação atualizada de um usuário."""
-    with get_db_connection() as conn:
-        with conn.cursor(cursor_factory=DictCursor) as cursor:
-            try:
-                cursor.execute("SELECT updated_at FROM transactions WHERE user_telegram_id = %s ORDER BY updated_at DESC LIMIT 1", (telegram_id,))
-                result = cursor.fetchone()
-                if result:
-                    return result['updated_at'].strftime('%d/%m/%Y %H:%M')
-                return "Nenhuma transação"
-            except psycopg2.Error as e:
-                logger.error(f"❌ Erro ao buscar última data de transação para {telegram_id}: {e}", exc_info=True)
-                return "Erro ao consultar"
-
-init_db()
\ No newline at end of file
@@ -0,0 +1,22 @@
+# gunicorn_conf.py
+"""
+🦄 Configuração do Gunicorn
+---------------------------
+Servidor de produção do webhook_server.py (ver railway.json).
+
+Um único worker com várias threads: o bot, o pool do banco e o controle de notificações
+duplicadas vivem na memória do processo, e as threads deixam um webhook lento (MP/banco)
+rodar sem segurar os próximos. Sem preload_app: o pool do banco e a sessão HTTP são
+criados dentro do worker, nunca herdados de um fork.
+"""
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+workers = 1
+worker_class = "gthread"
+threads = int(os.getenv("WEB_THREADS", "8"))
+worker_tmp_dir = "/tmp"
+timeout = 30
+graceful_timeout = 30
+keepalive = 5
+preload_app = False
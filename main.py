@@ -9,39 +9,71 @@ privacidade, automação e facilidade de uso.
 import telebot
 from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton
 import logging
-from logging.handlers import RotatingFileHandler
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
+import atexit
+import queue
 import base64
 from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
 
 # Módulos internos do projeto
 import config      # ⚙️ Configurações, chaves e mensagens
 import database    # 🗃️ Operações com banco de dados
 import pay         # 💳 Integração com gateway de pagamento
 import adm         # 👑 Funções administrativas
+import throttle    # 🚦 Controle de envio ao Telegram
 
 # =============================================
 # 📜 CONFIGURAÇÃO DE LOGGING
 # =============================================
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        RotatingFileHandler("flexypay.log", maxBytes=5*1024*1024, backupCount=3),
-        logging.StreamHandler()
-    ]
-)
+# Os handlers só enfileiram o registro; a escrita em arquivo/console acontece na thread do
+# QueueListener, fora das threads que atendem o Telegram.
+_log_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+_log_handlers = [
+    RotatingFileHandler("flexypay.log", maxBytes=5*1024*1024, backupCount=3),
+    logging.StreamHandler()
+]
+for _handler in _log_handlers:
+    _handler.setFormatter(_log_formatter)
+
+_log_queue = queue.SimpleQueue()
+_queue_handler = QueueHandler(_log_queue)
+# Só a mensagem é montada na thread de origem; o formato completo é aplicado pelos handlers reais
+_queue_handler.setFormatter(logging.Formatter('%(message)s'))
+logging.basicConfig(level=logging.INFO, handlers=[_queue_handler])
+
+_log_listener = QueueListener(_log_queue, *_log_handlers, respect_handler_level=True)
+_log_listener.start()
+atexit.register(_log_listener.stop)  # Esvazia a fila antes de o processo terminar
 logger = logging.getLogger(__name__)
 
 # =============================================
 # 🚀 INICIALIZAÇÃO DO BOT
 # =============================================
-bot = telebot.TeleBot(config.TELEGRAM_BOT_TOKEN, parse_mode="Markdown")
+bot = telebot.TeleBot(config.TELEGRAM_BOT_TOKEN, parse_mode="Markdown", num_threads=config.BOT_NUM_THREADS)
 adm.register_admin_handlers(bot)
 
 logger.info(f"✅ Iniciando {config.NOME_BOT}...")
 logger.info(f"   - Modo: {'PRODUÇÃO' if config.PRODUCTION else 'DESENVOLVIMENTO'}")
 logger.info(f"   - Admins Configurados: {len(config.ADMIN_TELEGRAM_IDS)}")
 
+# =============================================
+# 📤 ENVIO DE MENSAGENS
+# =============================================
+# As respostas aos usuários são enfileiradas no throttle (limite de envio + ordem por chat):
+# o handler retorna logo, sem esperar a chamada HTTP ao Telegram.
+def _send_message(chat_id, text, **kwargs):
+    return throttle.submit(bot.send_message, chat_id, text, chat_id=chat_id, **kwargs)
+
+def _reply_to(message, text, **kwargs):
+    return throttle.submit(bot.reply_to, message, text, chat_id=message.chat.id, **kwargs)
+
+def _answer_callback_query(call):
+    # A resposta ao clique não precisa de ordem com as mensagens do chat: fila própria (o id do
+    # callback), para não esperar atrás de mensagens ainda retidas pelo limite do chat
+    return throttle.submit(bot.answer_callback_query, call.id, lane=call.id)
+
 # =============================================
 # 🎬 FUNÇÃO PARA CRIAR O MENU PRINCIPAL
 # =============================================
@@ -60,6 +92,114 @@ def criar_menu_principal():
     markup.add(btn_depositar, btn_sacar, btn_carteira, btn_taxas, btn_suporte, btn_canal)
     return markup
 
+# O menu é sempre o mesmo: é montado uma única vez e reutilizado em todas as respostas
+_MAIN_MENU = criar_menu_principal()
+
+# Textos fixos das respostas: dependem só do config, então são montados uma única vez no import
+_TEXTO_TAXAS = (
+    "💰 *Taxas de Operação*\n\n"
+    "📥 *DEPÓSITO:*\n"
+    f"• *{config.TAXA_DEPOSITO_PERCENTUAL * 100:.1f}%* sobre o valor depositado.\n"
+    "_Ex: Ao depositar R$100, você recebe R$89 em saldo._\n\n"
+    "📤 *SAQUE:*\n"
+    f"• *{config.TAXA_SAQUE_PERCENTUAL * 100:.1f}%* sobre o valor a receber\n"
+    f"• *+ R$ {config.TAXA_SAQUE_FIXA:.2f}* fixos por transação."
+)
+_SUPORTE_MARKUP = InlineKeyboardMarkup().add(InlineKeyboardButton(text="🤖 Falar com o Suporte", url=config.BOT_SUPORTE))
+_SUPORTE_MSG = (
+    f"🛎️ *Suporte {config.NOME_BOT}*\n\n"
+    "Clique no botão para falar com nossa equipe.\n"
+    "Seu ID de usuário: `{user_id}`"
+)
+# Taxas de saque em inteiros: centavos (fixa) e pontos-base, 1/10000 (percentual)
+_TAXA_SAQUE_FIXA_CENTS = int(round(config.TAXA_SAQUE_FIXA * 100))
+_TAXA_SAQUE_BP = int(round(config.TAXA_SAQUE_PERCENTUAL * 10000))
+
+def _parse_cents(text):
+    """Converte o valor digitado ("100", "99,90") em centavos inteiros. Lança ValueError se inválido."""
+    try:
+        return int(Decimal(text.replace(',', '.')).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP) * 100)
+    except InvalidOperation:
+        raise ValueError(f"valor inválido: {text!r}")
+
+# Respostas com dados da operação: só os campos variáveis são preenchidos com .format() no handler
+_CARTEIRA_TEMPLATE = (
+    f"💼 *Sua Carteira {config.NOME_BOT}*\n\n"
+    "👤 Titular: {name}\n"
+    "🆔 ID: `{user_id}`\n\n"
+    "💰 *Saldo Disponível:*\n"
+    "   *R$ {saldo:.2f}*\n\n"
+    "📅 Última movimentação: {last_update}"
+)
+_PIX_CAPTION_TEMPLATE = (
+    "✅ *PIX Gerado com Sucesso!*\n\n"
+    "Valor a pagar: *R$ {valor:.2f}*\n"
+    "ID da Transação: `{transaction_id}`\n\n"
+    "👇 *Copie o código abaixo e pague no seu app do banco:*\n"
+    "`{pix_code}`"
+)
+_SAQUE_OK_TEMPLATE = (
+    "✅ *Solicitação de saque enviada!*\n\n"
+    "➖ Débito total: *R$ {debito:.2f}*\n"
+    "💸 Você receberá: *R$ {valor:.2f}*\n"
+    "📋 Taxa: R$ {taxa:.2f}\n\n"
+    "🔑 Chave PIX: `{chave_pix}`\n"
+    "🆔 ID: `{transaction_id}`"
+)
+_CANAL_MSG = f"📢 *Canal Oficial {config.NOME_BOT}*\n\nAcesse e fique por dentro de todas as novidades:\n{config.CANAL_OFICIAL}"
+
+# Imagem fixa enviada junto com cada PIX: lida do disco uma única vez.
+# Depois do primeiro envio, o Telegram devolve um file_id e os próximos envios usam só ele (sem upload).
+try:
+    with open('pix.jpg', 'rb') as _pix_file:
+        _PIX_IMAGE_BYTES = _pix_file.read()
+except FileNotFoundError:
+    _PIX_IMAGE_BYTES = None
+    logger.error("ERRO CRÍTICO: A imagem 'pix.jpg' não foi encontrada! Os PIX serão enviados como texto puro.")
+_PIX_FILE_ID = None
+
+# Threads que fazem a parte lenta do /pix (gateway + banco) fora das threads do bot
+_PIX_POOL = ThreadPoolExecutor(max_workers=config.BOT_NUM_THREADS, thread_name_prefix="pix")
+
+def _is_rate_limit(error):
+    return isinstance(error, telebot.apihelper.ApiTelegramException) and error.error_code == 429
+
+def _send_pix_photo(chat_id, caption, transaction_id):
+    """
+    Envia a imagem fixa do PIX com a legenda. Roda na fila de envio do chat (ver throttle.submit).
+    O depósito já foi gravado, então uma falha não pode sumir em silêncio: tenta a imagem, depois
+    o texto com formatação, depois o texto puro e, por fim, avisa o usuário do erro.
+    Um 429 é repassado ao throttle, que reenvia depois do retry_after.
+    """
+    global _PIX_FILE_ID
+    if _PIX_IMAGE_BYTES:
+        try:
+            if _PIX_FILE_ID:
+                return bot.send_photo(chat_id, photo=_PIX_FILE_ID, caption=caption)
+            sent = bot.send_photo(chat_id, photo=_PIX_IMAGE_BYTES, caption=caption)
+            _PIX_FILE_ID = sent.photo[-1].file_id
+            return sent
+        except Exception as e:
+            if _is_rate_limit(e):
+                raise
+            # Um file_id rejeitado é descartado; o próximo PIX refaz o upload
+            _PIX_FILE_ID = None
+            logger.error(f"❌ Falha ao enviar a imagem do PIX {transaction_id} para o chat {chat_id}: {e}")
+    # Sem a imagem (ou se ela falhou), o PIX vai como texto para não perder a transação.
+    for parse_mode in (None, ""):  # None = Markdown padrão do bot; "" = sem formatação
+        try:
+            return bot.send_message(chat_id, caption, parse_mode=parse_mode)
+        except Exception as e:
+            if _is_rate_limit(e):
+                raise
+            logger.error(f"❌ Falha ao enviar o texto do PIX {transaction_id} para o chat {chat_id}: {e}")
+    return bot.send_message(
+        chat_id,
+        f"❌ Não foi possível enviar o código do seu PIX (transação {transaction_id}). "
+        f"Use /pix para gerar um novo ou fale com o /suporte.",
+        parse_mode=""
+    )
+
 # =============================================
 # 🏷️ HANDLERS DE COMANDOS DO USUÁRIO
 # =============================================
@@ -71,43 +211,37 @@ def handle_start(message):
     """
     user = message.from_user
     logger.info(f"👋 Usuário {user.id} ('{user.first_name}') iniciou o bot.")
-    database.create_user_if_not_exists(user.id, user.username, user.first_name)
-    
-    saldo = database.get_balance(user.id)
-    
+    saldo = database.upsert_and_get_balance(user.id, user.username, user.first_name)
+
     # Mensagem de boas-vindas com saldo e botões
-    welcome_text = (
-        f"Olá, *{user.first_name}*!\n"
-        f"Seu saldo atual é de *R$ {saldo:.2f}*.\n\n"
-        f"👇 Escolha uma opção abaixo para começar:"
-    )
-    bot.reply_to(message, welcome_text, reply_markup=criar_menu_principal())
+    _reply_to(message, config.WELCOME_TEMPLATE.format(name=user.first_name, saldo=saldo), reply_markup=_MAIN_MENU)
 
 # =============================================
 # 📞 HANDLER PARA CALLBACKS DOS BOTÕES
 # =============================================
 
+# Ação do botão (callback_data "menu_<ação>") -> função que a atende.
+# Para um novo botão do menu, basta incluir a ação aqui.
+_MENU_DISPATCH = {
+    "depositar": lambda message: handle_pix_deposit(message, from_button=True),
+    "sacar": lambda message: _send_message(message.chat.id, "💸 Para sacar, use o comando no formato:\n`/sacar <sua_chave_pix> <valor_total_a_debitar>`\n\n*Exemplo:*\n`/sacar cpf:123.456.789-00 100`"),
+    "carteira": lambda message: handle_carteira(message, from_button=True),
+    "taxas": lambda message: handle_taxa(message, from_button=True),
+    "suporte": lambda message: handle_suporte(message, from_button=True),
+    "canal": lambda message: handle_canal(message, from_button=True),
+}
+
 @bot.callback_query_handler(func=lambda call: call.data.startswith('menu_'))
 def handle_menu_callbacks(call):
     """Processa os cliques nos botões do menu principal."""
     action = call.data.split('_')[1]
-    message = call.message
 
     # Responde ao clique para o Telegram saber que foi processado
-    bot.answer_callback_query(call.id)
-
-    if action == "depositar":
-        handle_pix_deposit(message, from_button=True)
-    elif action == "sacar":
-        bot.send_message(message.chat.id, "💸 Para sacar, use o comando no formato:\n`/sacar <sua_chave_pix> <valor_total_a_debitar>`\n\n*Exemplo:*\n`/sacar cpf:123.456.789-00 100`")
-    elif action == "carteira":
-        handle_carteira(message, from_button=True)
-    elif action == "taxas":
-        handle_taxa(message, from_button=True)
-    elif action == "suporte":
-        handle_suporte(message, from_button=True)
-    elif action == "canal":
-        handle_canal(message, from_button=True)
+    _answer_callback_query(call)
+
+    handler = _MENU_DISPATCH.get(action)
+    if handler:
+        handler(call.message)
 
 # =============================================
 # LÓGICA DOS COMANDOS
@@ -120,19 +254,11 @@ def handle_carteira(message, from_button=False):
     user = message.from_user
     if not from_button: logger.info(f"👤 Usuário {user.id} consultou a carteira via comando.")
     
-    database.create_user_if_not_exists(user.id, user.username, user.first_name)
-    saldo = database.get_balance(user.id)
-    last_update = database.get_last_transaction_date(user.id)
-    
-    response = (
-        f"💼 *Sua Carteira {config.NOME_BOT}*\n\n"
-        f"👤 Titular: {user.first_name}\n"
-        f"🆔 ID: `{user.id}`\n\n"
-        f"💰 *Saldo Disponível:*\n"
-        f"   *R$ {saldo:.2f}*\n\n"
-        f"📅 Última movimentação: {last_update}"
-    )
-    bot.send_message(message.chat.id, response)
+    # Uma única consulta: cria o usuário se preciso, saldo e última movimentação
+    saldo, last_update = database.get_wallet_snapshot(user.id, user.username, user.first_name)
+
+    response = _CARTEIRA_TEMPLATE.format(name=user.first_name, user_id=user.id, saldo=saldo, last_update=last_update)
+    _send_message(message.chat.id, response)
 
 @bot.message_handler(commands=['pix'])
 def handle_pix_deposit(message, from_button=False):
@@ -149,32 +275,42 @@ def handle_pix_deposit(message, from_button=False):
     
     # Se o comando foi acionado por um botão do menu, dê as instruções
     if from_button:
-        bot.send_message(message.chat.id, "📥 Para depositar, use o comando no formato:\n`/pix <valor>`\n\n*Exemplo:*\n`/pix 75.50`")
+        _send_message(message.chat.id, "📥 Para depositar, use o comando no formato:\n`/pix <valor>`\n\n*Exemplo:*\n`/pix 75.50`")
         return
 
     # Validação para o comando via texto
     if len(parts) < 2:
-        bot.reply_to(message, "⚠️ Formato incorreto!\nUso: `/pix <valor>`\nExemplo: `/pix 50`")
+        _reply_to(message, "⚠️ Formato incorreto!\nUso: `/pix <valor>`\nExemplo: `/pix 50`")
         return
 
     try:
         # Tenta converter o valor para um número
         valor = float(parts[1].replace(',', '.'))
-        
-        # Valida se o valor está dentro dos limites definidos em config.py
-        if not (config.LIMITE_MINIMO_DEPOSITO <= valor <= config.LIMITE_MAXIMO_DEPOSITO):
-            msg = f"⚠️ *Valor fora dos limites!*\nO depósito deve ser entre *R$ {config.LIMITE_MINIMO_DEPOSITO:.2f}* e *R$ {config.LIMITE_MAXIMO_DEPOSITO:.2f}*."
-            bot.reply_to(message, msg)
-            return
+    except ValueError:
+        _reply_to(message, "❌ Valor inválido. Use apenas números. Ex: `/pix 50.75`")
+        return
+
+    # Valida se o valor está dentro dos limites definidos em config.py
+    if not (config.LIMITE_MINIMO_DEPOSITO <= valor <= config.LIMITE_MAXIMO_DEPOSITO):
+        msg = f"⚠️ *Valor fora dos limites!*\nO depósito deve ser entre *R$ {config.LIMITE_MINIMO_DEPOSITO:.2f}* e *R$ {config.LIMITE_MAXIMO_DEPOSITO:.2f}*."
+        _reply_to(message, msg)
+        return
 
-        bot.send_chat_action(message.chat.id, 'typing')
-        
+    # Confirma na hora e deixa a chamada ao Mercado Pago para o pool do PIX:
+    # a thread do bot fica livre para atender outros usuários enquanto o gateway responde.
+    _reply_to(message, "⏳ Gerando seu PIX...")
+    _PIX_POOL.submit(_generate_and_send_pix, message, valor)
+
+def _generate_and_send_pix(message, valor):
+    """Gera a cobrança no gateway, grava a transação pendente e envia o PIX ao usuário."""
+    user = message.from_user
+    try:
         # Chama a função para gerar o pagamento no gateway
         pix_data = pay.generate_pix_payment(valor, user.id, f"Depósito {config.NOME_BOT} ID {user.id}")
 
         # Verifica se o gateway retornou um erro
         if not pix_data.get('success'):
-            bot.reply_to(message, f"❌ *Falha ao gerar PIX.*\nMotivo: {pix_data.get('error', 'Erro desconhecido.')}")
+            _reply_to(message, f"❌ *Falha ao gerar PIX.*\nMotivo: {pix_data.get('error', 'Erro desconhecido.')}")
             return
 
         # Grava a transação no banco de dados com status pendente
@@ -185,35 +321,17 @@ def handle_pix_deposit(message, from_button=False):
         )
 
         # Prepara o texto completo que irá na legenda da imagem
-        msg_pix_caption = (
-            f"✅ *PIX Gerado com Sucesso!*\n\n"
-            f"Valor a pagar: *R$ {valor:.2f}*\n"
-            f"ID da Transação: `{transaction_id}`\n\n"
-            f"👇 *Copie o código abaixo e pague no seu app do banco:*\n"
-            f"`{pix_data['pix_copy_paste']}`"
+        msg_pix_caption = _PIX_CAPTION_TEMPLATE.format(
+            valor=valor, transaction_id=transaction_id, pix_code=pix_data['pix_copy_paste']
         )
 
-        # --- LÓGICA DE ENVIO DA IMAGEM FIXA ---
-        # Tenta enviar a sua imagem personalizada com o texto do PIX na legenda.
-        try:
-            # O nome do arquivo deve ser exatamente o que você salvou na pasta do projeto
-            with open('pix.jpg', 'rb') as foto_fixa:
-                bot.send_photo(message.chat.id, photo=foto_fixa, caption=msg_pix_caption)
-            
-            logger.info(f"✅ PIX de R${valor:.2f} enviado com IMAGEM FIXA para usuário {user.id}.")
-
-        except FileNotFoundError:
-            # Se a imagem não for encontrada, o bot não trava.
-            # Ele envia uma mensagem de texto simples para não perder a transação.
-            logger.error("ERRO CRÍTICO: A imagem 'imagem_pix.png' não foi encontrada! Enviando PIX como texto puro.")
-            bot.send_message(message.chat.id, msg_pix_caption)
-        # --- FIM DA LÓGIca DE ENVIO ---
-
-    except ValueError:
-        bot.reply_to(message, "❌ Valor inválido. Use apenas números. Ex: `/pix 50.75`")
+        # Envia a imagem personalizada com o texto do PIX na legenda (na faixa de envio do chat,
+        # logo depois do "Gerando seu PIX...")
+        throttle.submit(_send_pix_photo, message.chat.id, msg_pix_caption, transaction_id, chat_id=message.chat.id)
+        logger.info(f"✅ PIX de R${valor:.2f} enfileirado para envio ao usuário {user.id}.")
     except Exception as e:
         logger.error(f"💥 Erro inesperado em /pix para {user.id}: {e}", exc_info=True)
-        bot.reply_to(message, "❌ Ocorreu um erro crítico. Tente novamente mais tarde.")
+        _reply_to(message, "❌ Ocorreu um erro crítico. Tente novamente mais tarde.")
 
 @bot.message_handler(commands=['sacar'])
 def handle_saque(message):
@@ -224,105 +342,108 @@ def handle_saque(message):
 
     parts = message.text.split()
     if len(parts) < 3:
-        bot.reply_to(message, "⚠️ *Uso incorreto!*\n`/sacar <sua_chave_pix> <valor_total_a_debitar>`\n\n*Exemplo:*\n`/sacar cpf:12345678900 100`")
+        _reply_to(message, "⚠️ *Uso incorreto!*\n`/sacar <sua_chave_pix> <valor_total_a_debitar>`\n\n*Exemplo:*\n`/sacar cpf:12345678900 100`")
         return
 
     chave_pix = parts[1]
     
     try:
-        valor_total_debito = float(parts[2].replace(',', '.'))
-        # (Lógica completa de saque que já fizemos)
-        if valor_total_debito <= config.TAXA_SAQUE_FIXA:
-            bot.reply_to(message, f"❌ O valor a debitar deve ser maior que a taxa fixa de R$ {config.TAXA_SAQUE_FIXA:.2f}.")
+        # Toda a conta é feita em centavos inteiros (sem erro de ponto flutuante)
+        debito_cents = _parse_cents(parts[2])
+        if debito_cents <= _TAXA_SAQUE_FIXA_CENTS:
+            _reply_to(message, f"❌ O valor a debitar deve ser maior que a taxa fixa de R$ {config.TAXA_SAQUE_FIXA:.2f}.")
             return
 
-        valor_a_receber = round((valor_total_debito - config.TAXA_SAQUE_FIXA) / (1 + config.TAXA_SAQUE_PERCENTUAL), 2)
-        
-        if valor_a_receber <= 0:
-             bot.reply_to(message, f"❌ O valor a debitar é muito baixo e não resulta em um saque válido.")
+        # receber = (débito - fixa) / (1 + percentual), arredondado ao centavo (meio centavo para cima)
+        numerador = (debito_cents - _TAXA_SAQUE_FIXA_CENTS) * 10000
+        denominador = 10000 + _TAXA_SAQUE_BP
+        receber_cents = (2 * numerador + denominador) // (2 * denominador)
+
+        if receber_cents <= 0:
+             _reply_to(message, f"❌ O valor a debitar é muito baixo e não resulta em um saque válido.")
              return
-        
-        taxa_final = round(valor_total_debito - valor_a_receber, 2)
+
+        # Valores em Decimal com 2 casas, como as colunas NUMERIC(12,2) do banco
+        valor_total_debito = Decimal(debito_cents).scaleb(-2)
+        valor_a_receber = Decimal(receber_cents).scaleb(-2)
+        taxa_final = Decimal(debito_cents - receber_cents).scaleb(-2)
         saldo_atual = database.get_balance(user.id)
 
         if saldo_atual < valor_total_debito:
-            bot.reply_to(message, f"❌ *Saldo insuficiente.*\nSeu saldo: *R$ {saldo_atual:.2f}* | Necessário: *R$ {valor_total_debito:.2f}*")
+            _reply_to(message, f"❌ *Saldo insuficiente.*\nSeu saldo: *R$ {saldo_atual:.2f}* | Necessário: *R$ {valor_total_debito:.2f}*")
             return
 
-        conn = database.get_db_connection()
-        conn.execute("BEGIN")
         try:
-            database.update_balance(user.id, -valor_total_debito, conn_ext=conn)
-            transaction_id = database.record_transaction(
-                conn_ext=conn, user_telegram_id=user.id, type="WITHDRAWAL",
-                amount=valor_a_receber, status=config.STATUS_EM_ANALISE, pix_key=chave_pix
-            )
-            database.record_transaction(
-                conn_ext=conn, user_telegram_id=user.id, type="FEE",
-                amount=taxa_final, status=config.STATUS_CONCLUIDO,
-                admin_notes=f"Taxa referente ao saque ID {transaction_id}"
-            )
-            conn.commit()
+            # Conexão do pool; o bloco inteiro é uma transação (commit ao sair, rollback em exceção)
+            with database.db() as conn:
+                # O débito é a primeira instrução: o UPDATE condicional trava a linha do usuário e só
+                # debita se houver saldo, então dois /sacar simultâneos são serializados pelo banco.
+                debitado = database.update_balance(user.id, -valor_total_debito, conn_ext=conn)
+                if debitado:
+                    # Saque + taxa em uma única ida ao banco
+                    transaction_id = database.record_withdrawal(
+                        user.id, valor_a_receber, taxa_final, chave_pix, conn_ext=conn
+                    )
+                    if not transaction_id:
+                        # Exceção dentro do bloco: rollback, o débito também é desfeito
+                        raise RuntimeError("falha ao registrar o saque ou a taxa")
+            database.invalidate_balance_cache(user.id)
+            if not debitado:
+                # O saldo mudou entre a consulta acima e o débito (ex.: outro saque ao mesmo tempo)
+                _reply_to(message, "❌ *Saldo insuficiente.*\nSeu saldo mudou durante a solicitação. Consulte a /carteira e tente novamente.")
+                return
+            # Só depois do commit; a notificação é enfileirada e não atrasa a resposta ao usuário
             adm.notify_admin_of_withdrawal_request(transaction_id, user.id, user.first_name, valor_a_receber, chave_pix)
-            bot.reply_to(message,
-                         f"✅ *Solicitação de saque enviada!*\n\n"
-                         f"➖ Débito total: *R$ {valor_total_debito:.2f}*\n"
-                         f"💸 Você receberá: *R$ {valor_a_receber:.2f}*\n"
-                         f"📋 Taxa: R$ {taxa_final:.2f}\n\n"
-                         f"🔑 Chave PIX: `{chave_pix}`\n"
-                         f"🆔 ID: `{transaction_id}`")
+            _reply_to(message, _SAQUE_OK_TEMPLATE.format(
+                debito=valor_total_debito, valor=valor_a_receber, taxa=taxa_final,
+                chave_pix=chave_pix, transaction_id=transaction_id
+            ))
         except Exception as e_atomic:
-            conn.rollback()
             logger.critical(f"💥 Erro atômico no /sacar para {user.id}: {e_atomic}", exc_info=True)
-            bot.reply_to(message, "❌ Erro crítico ao registrar sua solicitação. Nenhum valor foi debitado.")
-        finally:
-            if conn: conn.close()
+            _reply_to(message, "❌ Erro crítico ao registrar sua solicitação. Nenhum valor foi debitado.")
     except ValueError:
-        bot.reply_to(message, "❌ Valor inválido. Ex: `/sacar chave@pix.com 100`")
+        _reply_to(message, "❌ Valor inválido. Ex: `/sacar chave@pix.com 100`")
     except Exception as e:
         logger.error(f"💥 Erro inesperado no /sacar para {user.id}: {e}", exc_info=True)
-        bot.reply_to(message, "❌ Ocorreu um erro inesperado.")
+        _reply_to(message, "❌ Ocorreu um erro inesperado.")
 
 @bot.message_handler(commands=['taxa'])
 def handle_taxa(message, from_button=False):
     """Exibe as taxas de operação de forma clara para o usuário."""
     if not from_button: logger.info(f"💰 Usuário {message.from_user.id} consultou as taxas.")
-    texto_taxas = (
-        "💰 *Taxas de Operação*\n\n"
-        "📥 *DEPÓSITO:*\n"
-        f"• *{config.TAXA_DEPOSITO_PERCENTUAL * 100:.1f}%* sobre o valor depositado.\n"
-        "_Ex: Ao depositar R$100, você recebe R$89 em saldo._\n\n"
-        "📤 *SAQUE:*\n"
-        f"• *{config.TAXA_SAQUE_PERCENTUAL * 100:.1f}%* sobre o valor a receber\n"
-        f"• *+ R$ {config.TAXA_SAQUE_FIXA:.2f}* fixos por transação."
-    )
-    bot.send_message(message.chat.id, texto_taxas)
+    _send_message(message.chat.id, _TEXTO_TAXAS)
 
 @bot.message_handler(commands=['suporte'])
 def handle_suporte(message, from_button=False):
     """Fornece os canais de suporte ao usuário."""
     if not from_button: logger.info(f"🆘 Usuário {message.from_user.id} solicitou suporte.")
-    markup = InlineKeyboardMarkup().add(InlineKeyboardButton(text="🤖 Falar com o Suporte", url=config.BOT_SUPORTE))
-    support_msg = (
-        f"🛎️ *Suporte {config.NOME_BOT}*\n\n"
-        f"Clique no botão para falar com nossa equipe.\n"
-        f"Seu ID de usuário: `{message.from_user.id}`"
-    )
-    bot.send_message(message.chat.id, support_msg, reply_markup=markup, disable_web_page_preview=True)
+    _send_message(message.chat.id, _SUPORTE_MSG.format(user_id=message.from_user.id),
+                  reply_markup=_SUPORTE_MARKUP, disable_web_page_preview=True)
 
 @bot.message_handler(commands=['canal'])
 def handle_canal(message, from_button=False):
     """Envia o link do canal oficial."""
     if not from_button: logger.info(f"📢 Usuário {message.from_user.id} pediu o link do canal.")
-    channel_msg = f"📢 *Canal Oficial {config.NOME_BOT}*\n\nAcesse e fique por dentro de todas as novidades:\n{config.CANAL_OFICIAL}"
-    bot.send_message(message.chat.id, channel_msg, disable_web_page_preview=True)
+    _send_message(message.chat.id, _CANAL_MSG, disable_web_page_preview=True)
 
 # =============================================
 # ▶️ INICIAR O BOT
 # =============================================
+# O bot não faz polling: o Telegram envia cada atualização para a rota /webhook/telegram
+# do webhook_server.py, que a repassa para os handlers acima.
+def configure_webhook():
+    """Registra no Telegram a URL do webhook do bot. Retorna True se o registro foi feito."""
+    if not config.WEBHOOK_URL:
+        logger.critical("🆘 WEBHOOK_URL não configurada: o bot não receberá atualizações do Telegram.")
+        return False
+    if not config.TELEGRAM_WEBHOOK_SECRET:
+        logger.critical("🆘 TELEGRAM_WEBHOOK_SECRET não configurado: o webhook do Telegram não será registrado.")
+        return False
+    webhook_url = config.WEBHOOK_URL.rstrip('/') + '/webhook/telegram'
+    bot.set_webhook(url=webhook_url, secret_token=config.TELEGRAM_WEBHOOK_SECRET)
+    logger.info(f"🔗 Webhook do Telegram registrado em {webhook_url}.")
+    return True
+
 if __name__ == '__main__':
-    logger.info("--- BOT INICIADO E PRONTO PARA RECEBER COMANDOS ---")
-    try:
-        bot.infinity_polling(timeout=30, long_polling_timeout=5)
-    except Exception as e:
-        logger.critical(f"🆘 O BOT PAROU DE FUNCIONAR! Erro fatal no polling: {e}", exc_info=True)
\ No newline at end of file
+    # Apenas (re)registra o webhook; quem recebe as atualizações é o webhook_server.py (ver railway.json)
+    configure_webhook()
\ No newline at end of file
@@ -6,17 +6,47 @@ Responsável pela integração com o gateway de pagamento (Mercado Pago).
 Inclui funções para gerar cobranças PIX e processar pagamentos de saque (payouts).
 """
 import mercadopago
+from mercadopago.http.http_client import HttpClient
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
 import logging
+import threading
+import time
 import uuid
 import config
 
 logger = logging.getLogger(__name__)
 
+# Sessão HTTP persistente: reaproveita as conexões TCP/TLS com a API do Mercado Pago
+# em vez de refazer o handshake a cada cobrança/consulta/payout.
+_SESSION = requests.Session()
+# pool_maxsize cobre as threads que chamam o MP ao mesmo tempo (pool do /pix + threads do webhook),
+# para nenhuma delas abrir uma conexão extra descartada depois. O Retry padrão não repete POST,
+# então uma cobrança nunca é criada em dobro.
+_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=10, pool_maxsize=20,
+    max_retries=Retry(total=3, backoff_factor=0.2, status_forcelist=[429, 500, 502, 503, 504])
+))
+
+class _PooledHttpClient(HttpClient):
+    """HttpClient do SDK que usa a sessão compartilhada (o cliente padrão cria uma sessão por requisição)."""
+
+    def request(self, method, url, maxretries=None, **kwargs):
+        api_result = _SESSION.request(method, url, **kwargs)
+        response = {"status": api_result.status_code, "response": None}
+        if api_result.status_code != 204 and api_result.content:
+            try:
+                response["response"] = api_result.json()
+            except ValueError as e:
+                logger.error(f"❌ Resposta inválida (não-JSON) do Mercado Pago em {method} {url}: {e}")
+        return response
+
 # Inicialização segura do SDK do Mercado Pago
 sdk = None
 if config.MERCADOPAGO_ACCESS_TOKEN:
     try:
-        sdk = mercadopago.SDK(config.MERCADOPAGO_ACCESS_TOKEN)
+        sdk = mercadopago.SDK(config.MERCADOPAGO_ACCESS_TOKEN, http_client=_PooledHttpClient())
         logger.info("✅ SDK do Mercado Pago inicializado com sucesso.")
     except Exception as e:
         logger.error(f"❌ Falha ao inicializar SDK do Mercado Pago: {e}", exc_info=True)
@@ -122,6 +152,7 @@ def process_payout(transaction_id_local, amount, pix_key_receiver, description):
 
     try:
         # A sintaxe para Payouts pode variar. Ex: sdk.payout().create(...)
+        # (o sdk já usa a sessão HTTP persistente _SESSION; uma chamada direta deve usar _SESSION.post)
         # Esta é uma chamada hipotética.
         # response = sdk.payout().create(payout_data)
         
@@ -141,14 +172,35 @@ def process_payout(transaction_id_local, amount, pix_key_receiver, description):
         logger.error(f"💥 Exceção catastrófica ao processar payout para {transaction_id_local}: {e}", exc_info=True)
         return {'success': False, 'payout_id': None, 'message': 'Erro crítico na comunicação com o gateway.'}
 
+# Cache curto dos detalhes de pagamento, para as notificações repetidas do MP não refazerem a consulta.
+# Só status finais entram no cache: um "pending" guardado esconderia a aprovação que chega logo depois.
+PAYMENT_DETAILS_TTL = 8
+_FINAL_PAYMENT_STATUSES = frozenset({"approved", "rejected", "cancelled", "refunded", "charged_back"})
+_MAX_CACHED_PAYMENTS = 1000
+_payment_details_cache = {}
+_payment_details_lock = threading.Lock()
+
 def get_payment_details(mercado_pago_id):
     """Busca os detalhes de um pagamento existente no Mercado Pago."""
     if not sdk:
         logger.error("❌ Tentativa de buscar detalhes de pagamento com SDK não inicializado.")
         return None
+    key = str(mercado_pago_id)
+    now = time.monotonic()
+    with _payment_details_lock:
+        cached = _payment_details_cache.get(key)
+    if cached and cached[0] > now:
+        return cached[1]
     try:
         payment_info = sdk.payment().get(mercado_pago_id)
-        return payment_info.get("response")
+        details = payment_info.get("response")
+        if details and details.get("status") in _FINAL_PAYMENT_STATUSES:
+            with _payment_details_lock:
+                if len(_payment_details_cache) >= _MAX_CACHED_PAYMENTS:
+                    for expired_key in [k for k, (expires, _) in _payment_details_cache.items() if expires <= now]:
+                        del _payment_details_cache[expired_key]
+                _payment_details_cache[key] = (now + PAYMENT_DETAILS_TTL, details)
+        return details
     except Exception as e:
         logger.error(f"❌ Erro ao buscar detalhes do pagamento MP ID {mercado_pago_id}: {e}", exc_info=True)
         return None
\ No newline at end of file
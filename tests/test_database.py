@@ -0,0 +1,133 @@
+# tests/test_database.py
+"""Testes das leituras em autocommit (database._read_only) sobre o pool de conexões."""
+import os
+import sys
+import unittest
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123:test")
+
+import psycopg2
+import database
+
+
+class _FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        if not self.conn.autocommit:
+            self.conn.in_transaction = True
+        self.conn.executed.append(sql)
+
+    def fetchone(self):
+        return {'balance': Decimal("12.34")}
+
+
+class _FakeConnection:
+    """Imita o psycopg2 2.9: `with conn` abre transação mesmo em autocommit, e aí set_session falha."""
+    prepared = True
+    closed = 0
+
+    def __init__(self):
+        self._autocommit = False
+        self.in_transaction = False
+        self.executed = []
+
+    @property
+    def autocommit(self):
+        return self._autocommit
+
+    @autocommit.setter
+    def autocommit(self, value):
+        if self.in_transaction:
+            raise psycopg2.ProgrammingError("set_session cannot be used inside a transaction")
+        self._autocommit = value
+
+    def __enter__(self):
+        self.in_transaction = True
+        return self
+
+    def __exit__(self, *exc):
+        self.in_transaction = False
+        return False
+
+    def cursor(self, cursor_factory=None):
+        return _FakeCursor(self)
+
+    def commit(self):
+        self.in_transaction = False
+
+    def rollback(self):
+        self.in_transaction = False
+
+
+class _FakePool:
+    def __init__(self, conn):
+        self.conn = conn
+        self.returned = []
+
+    def getconn(self):
+        return self.conn
+
+    def putconn(self, conn, close=False):
+        self.returned.append((conn.autocommit, close))
+
+
+class ReadOnlyConnectionTest(unittest.TestCase):
+    def setUp(self):
+        self._saved = (database._pool, database._schema_ready)
+        database._schema_ready = True
+
+    def tearDown(self):
+        database._pool, database._schema_ready = self._saved
+
+    def test_read_helper_twice_on_same_connection(self):
+        conn = _FakeConnection()
+        database._pool = pool = _FakePool(conn)
+        for _ in range(2):
+            database.invalidate_balance_cache(1)
+            self.assertEqual(database.get_balance(1), Decimal("12.34"))
+        self.assertEqual(len(conn.executed), 2)
+        # A conexão volta ao pool fora do autocommit e sem ser descartada
+        self.assertEqual(pool.returned, [(False, False), (False, False)])
+
+
+@unittest.skipUnless(os.getenv("TEST_DATABASE_URL"), "TEST_DATABASE_URL não definida")
+class ReadOnlyPostgresTest(unittest.TestCase):
+    """Mesmo cenário contra um PostgreSQL real, com pool de uma única conexão."""
+
+    def setUp(self):
+        self._saved = (database._pool, database._schema_ready)
+        database._schema_ready = False
+        database._pool = database.ThreadedConnectionPool(
+            1, 1, os.environ["TEST_DATABASE_URL"], connection_factory=database._PooledConnection
+        )
+
+    def tearDown(self):
+        database._pool.closeall()
+        database._pool, database._schema_ready = self._saved
+
+    def test_read_helpers_twice_on_same_connection(self):
+        for _ in range(2):
+            database.invalidate_balance_cache(1)
+            database.get_balance(1)
+            database.get_transaction_details(1)
+            database._invalidate_profit_cache()
+            database.calculate_profits()
+        conn = database._pool.getconn()
+        try:
+            self.assertFalse(conn.autocommit)
+        finally:
+            database._pool.putconn(conn)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+# tests/test_throttle.py
+"""Testes do envio em segundo plano (throttle.submit) com uma função de envio falsa."""
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import telebot
+import throttle
+
+
+def _too_many_requests(retry_after):
+    """Erro 429 como o pyTelegramBotAPI o lança."""
+    return telebot.apihelper.ApiTelegramException(
+        "sendMessage", None,
+        {"error_code": 429, "description": "Too Many Requests", "parameters": {"retry_after": retry_after}},
+    )
+
+
+class _FakeSender:
+    """Registra (chat, item, instante) de cada envio."""
+
+    def __init__(self):
+        self.sent = []
+        self._lock = threading.Lock()
+        self._start = time.monotonic()
+
+    def __call__(self, chat_id, item):
+        with self._lock:
+            self.sent.append((chat_id, item, time.monotonic() - self._start))
+        return item
+
+
+class SubmitTest(unittest.TestCase):
+    def test_fifo_per_chat(self):
+        send = _FakeSender()
+        chat_id = 9001
+        throttle._chat_buckets[chat_id] = throttle.TokenBucket(rate=50, capacity=1)
+        futures = [throttle.submit(send, chat_id, i, chat_id=chat_id) for i in range(20)]
+        self.assertEqual([f.result(timeout=5) for f in futures], list(range(20)))
+        self.assertEqual([item for _, item, _ in send.sent], list(range(20)))
+
+    def test_busy_chat_does_not_delay_other_chats(self):
+        send = _FakeSender()
+        busy_chat, other_chat = 9002, 9003
+        # 1 mensagem/s para o chat ocupado: 5 envios levam ~4s
+        throttle._chat_buckets[busy_chat] = throttle.TokenBucket(rate=1, capacity=1)
+        busy = [throttle.submit(send, busy_chat, i, chat_id=busy_chat) for i in range(5)]
+        # Mais chats do que workers, para que uma fila presa em um worker apareça como atraso
+        others = [throttle.submit(send, other_chat + n, n, chat_id=other_chat + n) for n in range(throttle.SEND_WORKERS * 2)]
+        for f in others:
+            f.result(timeout=5)
+        other_times = [t for chat, _, t in send.sent if chat != busy_chat]
+        self.assertLess(max(other_times), 0.5)
+        self.assertFalse(busy[-1].done())
+        for f in busy:
+            f.result(timeout=10)
+
+    def test_single_retry_after_429(self):
+        chat_id = 9100
+        calls = []
+
+        def flaky():
+            calls.append(time.monotonic())
+            if len(calls) == 1:
+                raise _too_many_requests(0.2)
+            return "ok"
+
+        self.assertEqual(throttle.submit(flaky, chat_id=chat_id).result(timeout=5), "ok")
+        self.assertEqual(len(calls), 2)
+        self.assertGreaterEqual(calls[1] - calls[0], 0.2)
+
+    def test_second_429_is_not_retried(self):
+        calls = []
+
+        def always_limited():
+            calls.append(time.monotonic())
+            raise _too_many_requests(0.1)
+
+        future = throttle.submit(always_limited, chat_id=9101)
+        with self.assertRaises(telebot.apihelper.ApiTelegramException):
+            future.result(timeout=5)
+        self.assertEqual(len(calls), 2)
+
+    def test_retry_keeps_chat_order(self):
+        send = _FakeSender()
+        chat_id = 9102
+        limited = []
+
+        def first():
+            if not limited:
+                limited.append(True)
+                raise _too_many_requests(0.1)
+            return send(chat_id, 0)
+
+        futures = [throttle.submit(first, chat_id=chat_id)]
+        futures += [throttle.submit(send, chat_id, i, chat_id=chat_id) for i in (1, 2)]
+        for f in futures:
+            f.result(timeout=5)
+        self.assertEqual([item for _, item, _ in send.sent], [0, 1, 2])
+
+
+if __name__ == '__main__':
+    unittest.main()
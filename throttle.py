@@ -0,0 +1,203 @@
+# throttle.py
+"""
+🚦 Módulo de Controle de Envio
+------------------------------
+Limita a taxa de chamadas à API do Telegram para evitar erros 429
+(Too Many Requests). Usa um token bucket global para o bot e um por chat.
+Os envios podem ser feitos em segundo plano (submit), sem bloquear os handlers.
+"""
+import threading
+import time
+import logging
+import heapq
+import itertools
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+import telebot
+
+logger = logging.getLogger(__name__)
+
+class TokenBucket:
+    """Token bucket thread-safe: permite rajadas de até `capacity` e repõe `rate` tokens por segundo."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_acquire(self):
+        """Consome um token se houver e retorna 0; senão, sem bloquear, retorna os segundos até o próximo."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self):
+        """Bloqueia até haver um token disponível e o consome."""
+        while True:
+            wait = self.try_acquire()
+            if not wait:
+                return
+            time.sleep(wait)
+
+    def is_idle(self):
+        """Indica se o bucket está cheio, ou seja, se pode ser descartado sem perder estado."""
+        with self._lock:
+            elapsed = time.monotonic() - self._last
+            return self._tokens + elapsed * self.rate >= self.capacity
+
+
+# Limites da API do Telegram: ~30 mensagens/s por bot e ~1 mensagem/s por chat.
+# O bucket por chat aceita uma pequena rajada para não atrasar respostas isoladas.
+_bot_bucket = TokenBucket(rate=28, capacity=28)
+_chat_buckets = {}
+_chat_buckets_lock = threading.Lock()
+_MAX_CHAT_BUCKETS = 10000
+
+def _chat_bucket(chat_id):
+    """Retorna (criando se necessário) o bucket de um chat."""
+    with _chat_buckets_lock:
+        bucket = _chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(_chat_buckets) >= _MAX_CHAT_BUCKETS:
+                # Descarta os buckets ociosos para o dicionário não crescer indefinidamente
+                for idle_chat_id in [cid for cid, b in _chat_buckets.items() if b.is_idle()]:
+                    del _chat_buckets[idle_chat_id]
+            bucket = _chat_buckets[chat_id] = TokenBucket(rate=1, capacity=3)
+        return bucket
+
+def call(fn, *args, chat_id=None, **kwargs):
+    """
+    Executa uma chamada à API do Telegram respeitando os limites de envio.
+    Se o Telegram responder 429, aguarda o `retry_after` informado e tenta mais uma vez.
+    """
+    _bot_bucket.acquire()
+    if chat_id is not None:
+        _chat_bucket(chat_id).acquire()
+    try:
+        return fn(*args, **kwargs)
+    except telebot.apihelper.ApiTelegramException as e:
+        if e.error_code != 429:
+            raise
+        retry_after = (e.result_json.get('parameters') or {}).get('retry_after', 1)
+        logger.warning("⏳ Limite do Telegram atingido (chat %s). Aguardando %ss para reenviar.", chat_id, retry_after)
+        time.sleep(retry_after)
+        return fn(*args, **kwargs)
+
+
+# Envio em segundo plano: cada chat tem a sua fila (ordem FIFO garantida) e no máximo uma
+# tarefa dele em andamento. Uma fila só ocupa um worker quando o limite do chat libera o envio;
+# enquanto espera (limite por chat ou 429), o pedido fica no agendador e o worker atende
+# outros chats. Assim um chat com muitas mensagens não atrasa os demais.
+SEND_WORKERS = 8
+_send_pool = ThreadPoolExecutor(max_workers=SEND_WORKERS, thread_name_prefix="send")
+_queues = {}       # chave do chat -> deque de _SendTask
+_queues_lock = threading.Lock()
+_timers = []       # heap de (instante, seq, chave): filas esperando o limite do chat ou um 429
+_timers_cond = threading.Condition()
+_timers_seq = itertools.count()
+
+class _SendTask:
+    """Uma chamada enfileirada por submit()."""
+    __slots__ = ("fn", "args", "kwargs", "chat_id", "future", "retried")
+
+    def __init__(self, fn, args, kwargs, chat_id):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.chat_id = chat_id
+        self.future = Future()
+        self.retried = False
+
+def _log_failure(future):
+    """Registra o erro de um envio em segundo plano (ninguém espera pelo resultado)."""
+    if future.cancelled():
+        return
+    exc = future.exception()
+    if exc is not None:
+        logger.error("❌ Falha no envio em segundo plano para o Telegram: %s", exc)
+
+def submit(fn, *args, chat_id=None, lane=None, **kwargs):
+    """
+    Enfileira uma chamada à API do Telegram e retorna imediatamente um Future.
+    Chamadas com o mesmo `chat_id` (ou `lane`, quando informado) rodam na ordem em que foram
+    enfileiradas. Use `lane` para ordenar por chat sem consumir o limite por chat.
+    """
+    key = chat_id if lane is None else lane
+    task = _SendTask(fn, args, kwargs, chat_id)
+    task.future.add_done_callback(_log_failure)
+    with _queues_lock:
+        queue = _queues.get(key)
+        if queue is not None:
+            # A fila já está ativa: a tarefa sai na sua vez
+            queue.append(task)
+            return task.future
+        _queues[key] = deque([task])
+    _dispatch(key)
+    return task.future
+
+def _dispatch(key):
+    """Manda a próxima tarefa da fila para um worker, ou agenda para quando o chat tiver token."""
+    with _queues_lock:
+        task = _queues[key][0]
+    wait = 0 if task.chat_id is None else _chat_bucket(task.chat_id).try_acquire()
+    if wait:
+        _schedule(key, wait)
+    else:
+        _send_pool.submit(_run_next, key)
+
+def _run_next(key):
+    """Executa (no worker) a primeira tarefa da fila do chat e passa para a seguinte."""
+    with _queues_lock:
+        task = _queues[key].popleft()
+    if task.retried or task.future.set_running_or_notify_cancel():
+        try:
+            _bot_bucket.acquire()
+            result = task.fn(*task.args, **task.kwargs)
+        except telebot.apihelper.ApiTelegramException as e:
+            if e.error_code == 429 and not task.retried:
+                # Devolve a tarefa ao início da fila e libera o worker até o fim do retry_after
+                retry_after = (e.result_json.get('parameters') or {}).get('retry_after', 1)
+                logger.warning("⏳ Limite do Telegram atingido (chat %s). Reenviando em %ss.", task.chat_id, retry_after)
+                task.retried = True
+                with _queues_lock:
+                    _queues[key].appendleft(task)
+                _schedule(key, retry_after)
+                return
+            task.future.set_exception(e)
+        except Exception as e:
+            task.future.set_exception(e)
+        else:
+            task.future.set_result(result)
+    with _queues_lock:
+        if not _queues[key]:
+            del _queues[key]
+            return
+    _dispatch(key)
+
+def _schedule(key, delay):
+    """Retoma a fila do chat daqui a `delay` segundos, sem ocupar um worker enquanto isso."""
+    with _timers_cond:
+        heapq.heappush(_timers, (time.monotonic() + delay, next(_timers_seq), key))
+        _timers_cond.notify()
+
+def _timer_loop():
+    """Thread do agendador: devolve cada fila ao _dispatch quando chega a sua hora."""
+    while True:
+        with _timers_cond:
+            while not _timers:
+                _timers_cond.wait()
+            wait = _timers[0][0] - time.monotonic()
+            if wait > 0:
+                _timers_cond.wait(wait)
+                continue
+            _, _, key = heapq.heappop(_timers)
+        _dispatch(key)
+
+threading.Thread(target=_timer_loop, name="send-timer", daemon=True).start()
@@ -2,19 +2,83 @@
 from flask import Flask, request, jsonify
 import logging
 import json
+import hmac
+import threading
+import time
+from decimal import Decimal
+import telebot
 import config
 import database
 import pay
+import main  # Instância do bot com todos os handlers registrados
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
+# Uma falha ao falar com o Telegram aqui não pode derrubar o boot do worker (o gunicorn
+# reiniciaria em loop); o webhook registrado anteriormente continua valendo.
+try:
+    main.configure_webhook()
+except Exception as e:
+    logger.error(f"❌ Falha ao registrar o webhook do Telegram: {e}", exc_info=True)
+
+def _valid_telegram_secret(header_value):
+    """Confere o cabeçalho de segredo do Telegram em tempo constante. Sem segredo configurado, recusa."""
+    if not config.TELEGRAM_WEBHOOK_SECRET or header_value is None:
+        return False
+    return hmac.compare_digest(header_value.encode('utf-8'), config.TELEGRAM_WEBHOOK_SECRET.encode('utf-8'))
+
+@app.route('/webhook/telegram', methods=['POST'])
+def telegram_webhook():
+    """Recebe as atualizações do Telegram e as entrega aos handlers do bot."""
+    if not _valid_telegram_secret(request.headers.get('X-Telegram-Bot-Api-Secret-Token')):
+        logger.warning("Atualização do Telegram recusada: segredo do webhook inválido.")
+        return jsonify({"status": "error", "message": "Forbidden"}), 403
+
+    update = telebot.types.Update.de_json(request.get_data().decode('utf-8'))
+    # Os handlers rodam no pool de threads do bot; a resposta ao Telegram não espera por eles.
+    main.bot.process_new_updates([update])
+    return jsonify({"status": "ok"}), 200
+
+# Notificações duplicadas do MP: cada pagamento é processado por uma requisição de cada vez e,
+# depois de concluído, as repetições são descartadas por alguns minutos sem consultar o MP nem o banco.
+# Um único processo (gunicorn com 1 worker) atende o webhook, então o controle em memória basta.
+WEBHOOK_DEDUP_TTL = 300
+_MAX_DONE_PAYMENTS = 10000
+_payments_in_flight = set()
+_payments_done = {}
+_payments_lock = threading.Lock()
+
+def _claim_payment(payment_id):
+    """Reserva o pagamento para a requisição atual. Retorna False se for uma notificação duplicada."""
+    now = time.monotonic()
+    with _payments_lock:
+        if payment_id in _payments_in_flight or _payments_done.get(payment_id, 0) > now:
+            return False
+        if len(_payments_done) >= _MAX_DONE_PAYMENTS:
+            for expired_id in [pid for pid, expires in _payments_done.items() if expires <= now]:
+                del _payments_done[expired_id]
+            # Ainda cheio: descarta os mais antigos (o TTL é fixo, então a ordem de inserção é a de expiração)
+            while len(_payments_done) >= _MAX_DONE_PAYMENTS:
+                del _payments_done[next(iter(_payments_done))]
+        _payments_in_flight.add(payment_id)
+        return True
+
+def _release_payment(payment_id, done):
+    """Libera o pagamento; se `done`, descarta as próximas notificações dele por WEBHOOK_DEDUP_TTL segundos."""
+    with _payments_lock:
+        _payments_in_flight.discard(payment_id)
+        if done:
+            _payments_done.pop(payment_id, None)  # Reinsere no fim, mantendo a ordem por expiração
+            _payments_done[payment_id] = time.monotonic() + WEBHOOK_DEDUP_TTL
 
 @app.route('/webhook/mp', methods=['POST'])
 def mercadopago_webhook():
-    data = request.json
-    logger.info(f"Webhook recebido: {json.dumps(data, indent=2)}")
+    data = request.get_json(silent=True)
+    # O payload completo só é serializado quando o log de DEBUG está ligado
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Webhook recebido: %s", json.dumps(data, separators=(',', ':')))
 
     if data and data.get("type") == "payment":
         payment_id_mp = data.get("data", {}).get("id")
@@ -22,6 +86,14 @@ def mercadopago_webhook():
             logger.warning("Webhook de pagamento recebido sem ID.")
             return jsonify({"status": "error", "message": "No payment ID"}), 400
 
+        payment_id_mp = str(payment_id_mp)
+        if not _claim_payment(payment_id_mp):
+            logger.info(f"Notificação duplicada ignorada para o MP ID: {payment_id_mp}.")
+            return jsonify({"status": "ok", "message": "Duplicate notification"}), 200
+
+        # Só marca como concluído quando o depósito foi creditado por esta requisição; outros status
+        # (e "transação não encontrada") ainda podem mudar
+        done = False
         try:
             payment_details = pay.get_payment_details(payment_id_mp)
             if not payment_details:
@@ -32,16 +104,19 @@ def mercadopago_webhook():
             valor_pago = payment_details.get("transaction_amount")
             mp_id_str = str(payment_details.get("id"))
 
-            # <<< ALTERAÇÃO: Trocando '?' por '%s' na consulta >>>
-            conn = database.get_db_connection()
-            # Usando DictCursor para acessar colunas por nome
-            cursor = conn.cursor(cursor_factory=database.DictCursor)
-            cursor.execute("SELECT * FROM transactions WHERE mercado_pago_id = %s AND status = %s", 
-                           (mp_id_str, config.STATUS_DEPOSITO_PENDENTE))
-            transaction = cursor.fetchone()
-            conn.close()
+            # Conexão emprestada do pool e devolvida ao fim do bloco
+            with database.db() as conn:
+                # Usando DictCursor para acessar colunas por nome
+                with conn.cursor(cursor_factory=database.DictCursor) as cursor:
+                    # Só as colunas usadas abaixo, todas cobertas pelo índice idx_tx_mpid_status
+                    cursor.execute("SELECT id, user_telegram_id, amount FROM transactions "
+                                   "WHERE mercado_pago_id = %s AND status = %s LIMIT 1",
+                                   (mp_id_str, config.STATUS_DEPOSITO_PENDENTE))
+                    transaction = cursor.fetchone()
 
             if not transaction:
+                # Não marca como concluído: a notificação pode ter chegado antes de o /pix gravar a
+                # transação, e a próxima (ex.: "approved") precisa ser processada.
                 logger.warning(f"Transação PENDENTE não encontrada para o MP ID: {mp_id_str}.")
                 return jsonify({"status": "ok", "message": "Transaction already processed or not found"}), 200
 
@@ -54,26 +129,16 @@ def mercadopago_webhook():
                     database.update_transaction_status(transaction['id'], "ERRO_DIVERGENCIA", admin_notes=f"Esperado R${valor_deposito}, pago R${valor_pago}")
                     return jsonify({"status": "error", "message": "Amount mismatch"}), 400
 
-                taxa_deposito = valor_deposito * config.TAXA_DEPOSITO_PERCENTUAL
+                # valor_deposito vem do banco como Decimal; a taxa é arredondada para centavos
+                taxa_deposito = database.to_money(valor_deposito * Decimal(str(config.TAXA_DEPOSITO_PERCENTUAL)))
                 valor_liquido = valor_deposito - taxa_deposito
 
-                conn_atomic = database.get_db_connection()
-                try:
-                    database.update_balance(user_id, valor_liquido, conn_ext=conn_atomic)
-                    database.record_transaction(
-                        user_telegram_id=user_id, type="FEE", amount=taxa_deposito,
-                        status=config.STATUS_CONCLUIDO,
-                        admin_notes=f"Taxa de depósito referente à transação ID {transaction['id']}",
-                        conn_ext=conn_atomic
-                    )
-                    database.update_transaction_status(transaction['id'], config.STATUS_DEPOSITO_PAGO, conn_ext=conn_atomic)
-                    conn_atomic.commit()
+                # Crédito, taxa e mudança de status em uma única instrução (e transação)
+                if database.confirm_deposit(transaction['id'], user_id, valor_liquido, taxa_deposito):
+                    done = True
                     logger.info(f"Depósito ID {transaction['id']} para user {user_id} APROVADO. Valor creditado: R${valor_liquido:.2f}")
-                except Exception as e:
-                    if conn_atomic: conn_atomic.rollback()
-                    logger.critical(f"FALHA CRÍTICA ao processar depósito para MP ID {mp_id_str}: {e}")
-                finally:
-                    if conn_atomic: conn_atomic.close()
+                else:
+                    logger.critical(f"FALHA CRÍTICA ao processar depósito para MP ID {mp_id_str}: depósito não creditado.")
             else:
                 logger.info(f"Pagamento MP ID {mp_id_str} não foi aprovado. Status: {status_mp}")
                 database.update_transaction_status(transaction['id'], status_mp.upper())
@@ -82,8 +147,11 @@ def mercadopago_webhook():
         except Exception as e:
             logger.error(f"Erro ao processar webhook: {e}", exc_info=True)
             return jsonify({"status": "error", "message": "Internal server error"}), 500
+        finally:
+            _release_payment(payment_id_mp, done)
     
     return jsonify({"status": "ignored", "message": "Not a payment notification"}), 200
 
 if __name__ == '__main__':
-    app.run(port=5000, debug=True)
\ No newline at end of file
+    # Apenas para testes locais; em produção o app roda no gunicorn (gunicorn_conf.py)
+    app.run(port=5000, debug=not config.PRODUCTION, threaded=True)
\ No newline at end of file